@@ -1,8 +1,16 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
 from import_export.admin import ImportExportMixin, ImportMixin, ExportActionMixin
-from .. import models as m
+from .. import models as m, caching
 from . import resources as r, forms as f
+from .exports import StreamingExportMixin
+from .pagination import EstimatedCountPaginator
 
 
 @admin.display(description="Link to image")
@@ -18,10 +26,10 @@ def show_image_url(obj):
 @admin.display(description="Image preview")
 def image_preview(obj):
     """
-    Function to display the image as a hover preview
+    Function to display the image as a hover preview, using the resized copy from the image proxy
     """
     if obj.image_url:
-        return format_html('<a href="javascript:void(0)" class="hover-preview" data-preview="{url}">image</a>', url=obj.image_url)
+        return format_html('<a href="javascript:void(0)" class="hover-preview" data-preview="{url}">image</a>', url=obj.image_medium_url)
     return "No image"
 
 
@@ -42,18 +50,22 @@ class ImageFieldReorderedAdmin(admin.ModelAdmin):
 
 
 @admin.register(m.Event)
-class EventAdmin(ImportMixin, ExportActionMixin, ImageFieldReorderedAdmin):
+class EventAdmin(ImportMixin, StreamingExportMixin, ExportActionMixin, ImageFieldReorderedAdmin):
     """
     Admin class for the Event model.
     Field order defined in the fields attribute.
     """
     resource_class = r.EventParticipantResource
-    filter_horizontal = ('participants',)
     search_fields = ('title',)
     list_display = ('title', 'start_date', 'end_date', 'venue')
-    readonly_fields = (show_image_url,)
+    readonly_fields = (show_image_url, 'image_original_size', 'image_size')
     exclude = ('image_id',)
 
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'participants':
+            kwargs['widget'] = f.MemberSearchSelectMultiple(db_field.verbose_name, is_stacked=False)
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
 
 @admin.action(description="Mark selected members as inactive")
 def make_inactive(modeladmin, request, queryset):
@@ -74,16 +86,101 @@ class MemberAdmin(ImportExportMixin, admin.ModelAdmin):
     list_display = ('id', 'first_name', 'last_name', 'telegram_username', 'email', 'family')
     list_filter = ('is_active', 'is_admin', 'family')
     actions = (make_inactive,)
+    import_export_change_list_template = 'admin/backend/member/change_list.html'
+    search_page_size = 50
+
+    def get_urls(self):
+        return [
+            path('search/', self.admin_site.admin_view(self.search_view), name='backend_member_search'),
+            path(
+                'import-background/', self.admin_site.admin_view(self.background_import_view),
+                name='backend_member_background_import',
+            ),
+        ] + super().get_urls()
+
+    def background_import_view(self, request):
+        """
+        Queue a member roster for import by a background job, for files too large to import within a request
+        """
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        form = f.BackgroundImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            name = form.cleaned_data['import_file'].name
+            job = m.Job.objects.create(
+                kind='import_members',
+                payload={'format': form.cleaned_data['format'], 'filename': name},
+                data=form.cleaned_data['data'],
+                total=form.cleaned_data['rows'],
+            )
+            self.message_user(request, f"Queued the import of {name}, its progress is shown on this job.")
+            return redirect('admin:backend_job_change', job.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Import members in the background",
+            'opts': self.model._meta,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/backend/member/background_import.html', context)
+
+    def search_view(self, request):
+        """
+        JSON endpoint for the member pickers, returning a page of members matching the search term
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        term = request.GET.get('term', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        queryset = m.Member.objects.order_by('first_name', 'last_name', 'id')
+        for word in term.split():
+            queryset = queryset.filter(
+                Q(first_name__icontains=word) | Q(last_name__icontains=word) | Q(telegram_username__icontains=word)
+            )
+        # Fetch one extra row to know whether there is a next page, without counting
+        start = (page - 1) * self.search_page_size
+        members = list(queryset.only('first_name', 'last_name')[start:start + self.search_page_size + 1])
+        return JsonResponse({
+            'results': [{'id': member.pk, 'text': str(member)} for member in members[:self.search_page_size]],
+            'more': len(members) > self.search_page_size,
+        })
+
+
+@admin.action(description="Rebuild points of selected families from their submissions")
+def rebuild_points(modeladmin, request, queryset):
+    """
+    Admin action to resync the stored points of families, in a single UPDATE
+    """
+    count = queryset.rebuild_points()
+    # Updates bypass the signals that normally invalidate cached responses
+    caching.bump_model(m.Family)
+    modeladmin.message_user(request, f"Rebuilt the points of {count} families.")
 
 
 @admin.register(m.Family)
 class FamilyAdmin(ImportExportMixin, admin.ModelAdmin):
     """
     Admin class for the Family model.
+    Points are stored on the family, so the list can be sorted by them without adding up any submissions.
     """
     form = f.FamilyForm
-    readonly_fields = ('points',)
+    readonly_fields = ('points', 'live_points')
     list_display = ('id', 'fam_name', 'points')
+    ordering = ('-points',)
+    actions = (rebuild_points,)
+
+    @admin.display(description="Points from submissions")
+    def live_points(self, obj):
+        """
+        Points added up from the submissions, to compare against the stored points
+        """
+        if obj.pk is None:
+            return "-"
+        return m.Family.objects.filter(pk=obj.pk).with_live_points().values_list('live_points', flat=True).get()
 
 
 @admin.action(description="Mark selected submissions as vetted")
@@ -94,10 +191,29 @@ def make_vetted(modeladmin, request, queryset):
     queryset.update(vetted=True)
 
 
+class SuspectedDuplicateFilter(admin.SimpleListFilter):
+    """
+    Filter for submissions flagged as a resubmission of an earlier photo
+    """
+    title = "suspected duplicate"
+    parameter_name = "duplicate"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Yes"), ("no", "No"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "yes":
+            return queryset.filter(duplicate_of__isnull=False)
+        if self.value() == "no":
+            return queryset.filter(duplicate_of__isnull=True)
+        return queryset
+
+
 @admin.register(m.PhotoSubmission)
 class PhotoSubmissionAdmin(ImportExportMixin, ImageFieldReorderedAdmin):
     """
     Admin class for the PhotoSubmission model.
+    The changelist takes a fixed number of queries however many rows it shows.
     """
     class Media:
         js = [
@@ -108,12 +224,29 @@ class PhotoSubmissionAdmin(ImportExportMixin, ImageFieldReorderedAdmin):
         }
 
     list_display = ('id', 'date_uploaded', image_preview, 'member', 'family', 'description', 'number_of_people', 'score', 'vetted')
-    list_filter = ('family', 'vetted', 'description')
-    readonly_fields = (show_image_url,)
+    list_filter = ('family', 'vetted', 'description', SuspectedDuplicateFilter)
+    # The table is large, so avoid anything that counts or scans all of it
+    list_select_related = ('member', 'family')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    readonly_fields = (show_image_url, 'image_original_size', 'image_size', 'scoring_version')
+    raw_id_fields = ('duplicate_of',)
     exclude = ('image_id',)
     actions = (make_vetted,)
 
 
+@admin.register(m.ScoringRule)
+class ScoringRuleAdmin(admin.ModelAdmin):
+    """
+    Admin class for the ScoringRule model.
+    New submissions are scored with the latest version, older ones are rescored with `manage.py rescore_submissions`.
+    """
+    list_display = ('version', 'description', 'per_person', 'people_offset', 'base')
+    list_filter = ('version',)
+    ordering = ('-version', 'description')
+
+
 @admin.register(m.GroupChat)
 class GroupChatAdmin(admin.ModelAdmin):
     """
@@ -128,3 +261,25 @@ class ExcoMemberAdmin(ImportExportMixin, admin.ModelAdmin):
     Admin class for the ExcoMember model
     """
     list_display = ('id', 'name', 'role', 'year', 'major')
+
+
+@admin.register(m.Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Admin class for the Job model. Read only, jobs are created by the application.
+    """
+    list_display = ('id', 'kind', 'status', 'progress_display', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'kind')
+    exclude = ('data', 'progress', 'total')
+    readonly_fields = (
+        'kind', 'payload', 'status', 'progress_display', 'attempts', 'run_after', 'last_error', 'created_at', 'updated_at',
+    )
+
+    @admin.display(description="Progress")
+    def progress_display(self, obj):
+        if obj.total is None:
+            return "-"
+        return f"{obj.progress}/{obj.total}"
+
+    def has_add_permission(self, request):
+        return False
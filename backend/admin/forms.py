@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.admin.widgets import FilteredSelectMultiple
+from import_export.formats import base_formats
+from django.urls import reverse
 from .. import models as m
 
 
@@ -17,6 +19,27 @@ class ModdedFilteredSelectMultiple(FilteredSelectMultiple):
         ]
 
 
+class MemberSearchSelectMultiple(ModdedFilteredSelectMultiple):
+    """
+    Side by side member picker that only renders the selected members.
+    The available members are searched and paged in from the member admin's search endpoint instead,
+    so the page doesn't grow with the number of members.
+    """
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs["data-search-url"] = reverse("admin:backend_member_search")
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        pks = [pk for pk in value if str(pk).isdigit()]
+        members = self.choices.queryset.filter(pk__in=pks) if pks else []
+        label = self.choices.field.label_from_instance
+        return [
+            (None, [self.create_option(name, member.pk, label(member), True, index)], index)
+            for index, member in enumerate(members)
+        ]
+
+
 class FamilyForm(forms.ModelForm):
     """
     Custom form for the Family model to allow for the selection of members
@@ -25,7 +48,7 @@ class FamilyForm(forms.ModelForm):
     members = forms.ModelMultipleChoiceField(
         queryset=m.Member.objects.all(),
         required=False,
-        widget=ModdedFilteredSelectMultiple(
+        widget=MemberSearchSelectMultiple(
             verbose_name='Members',
             is_stacked=False
         ),
@@ -43,7 +66,19 @@ class FamilyForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if self.instance and self.instance.pk:
-            self.fields['members'].initial = self.instance.members.all()
+            self.fields['members'].initial = list(self.instance.members.values_list('pk', flat=True))
+
+    def save_members(self, family):
+        """
+        Move members in and out of the family, only touching the members that changed.
+        At most two UPDATEs, rather than reading every current member back as set() does.
+        """
+        current = set(family.members.values_list('pk', flat=True))
+        selected = {member.pk for member in self.cleaned_data['members']}
+        if removed := current - selected:
+            m.Member.objects.filter(family=family, pk__in=removed).update(family=None)
+        if added := selected - current:
+            m.Member.objects.filter(pk__in=added).update(family=family)
 
     def save(self, commit=True):
         """
@@ -52,7 +87,7 @@ class FamilyForm(forms.ModelForm):
         The function works as follows:
         1. Create the family instance by calling the parent save method
         2. Commit the instance to the database if commit is True
-        3. Set the members of the family instance to the members selected in the form
+        3. Move the members selected in the form into the family, and the unselected ones out of it
         4. Save the many-to-many relationship
         5. Return the family instance
         """
@@ -65,7 +100,34 @@ class FamilyForm(forms.ModelForm):
             family.save()
 
         if family.pk:
-            family.members.set(self.cleaned_data['members'])
+            self.save_members(family)
             self.save_m2m()
 
         return family
+
+
+class BackgroundImportForm(forms.Form):
+    """
+    Form to queue a member roster for import by a background job.
+    The file is read here to catch unreadable files and count its rows, but the rows are only imported by the job.
+    """
+    import_file = forms.FileField()
+    format = forms.ChoiceField(choices={"CSV": "csv", "XLSX": "xlsx"})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+
+        file_format = getattr(base_formats, cleaned_data["format"])()
+        data = cleaned_data["import_file"].read()
+        try:
+            dataset = file_format.create_dataset(data if file_format.is_binary() else data.decode("utf-8-sig"))
+        except Exception as e:
+            raise forms.ValidationError(f"Could not read the file as {file_format.get_title()}: {e}")
+        if "id" not in (dataset.headers or []):
+            raise forms.ValidationError("The file needs an id column, left blank for new members.")
+
+        cleaned_data["data"] = data
+        cleaned_data["rows"] = len(dataset)
+        return cleaned_data
@@ -0,0 +1,31 @@
+import json
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """
+    Number of rows the query planner expects the queryset to return, without running it.
+    Based on the table statistics, so it can be off by a few percent.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    plan = json.loads(queryset.explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts large querysets with the query planner's estimate rather than a COUNT(*),
+    which has to scan the whole table. Only querysets expected to have more than `threshold` rows are estimated,
+    smaller ones are counted exactly. The last pages of an estimated count may come out short or empty.
+    """
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate > self.threshold:
+            return estimate
+        return super().count
@@ -1,3 +1,5 @@
+import tablib
+from django.db.models.functions import TruncDate
 from django.utils.encoding import force_str
 from import_export import resources
 from .. import models as m
@@ -8,6 +10,8 @@ class EventParticipantResource(resources.ModelResource):
     Resource class for exporting participant data for events.
     Note that the metaclass uses the `Member` model since it's member data that we are exporting.
     """
+    chunk_size = 2000
+
     class Meta:
         model = m.Member
         # TODO: update this accordingly with member model changes
@@ -21,16 +25,33 @@ class EventParticipantResource(resources.ModelResource):
         export_headers = [force_str(field.column_name) for field in export_fields if field]
         return [header.replace("_", " ").capitalize() for header in export_headers]
 
+    def export_rows(self, queryset, export_fields=None):
+        """
+        Headers then one row per participant of each of the events in the queryset, with the event in front.
+        Rows are read as tuples, a chunk at a time, so that they can be written out as they come.
+        """
+        fields = [field.attribute for field in self.get_export_fields(export_fields) if field]
+        yield ["Event", "Event date", *self.get_export_headers(export_fields)]
+
+        participants = m.Event.participants.through.objects \
+            .filter(event__in=queryset.values('pk')) \
+            .order_by('event__start_date', 'event_id', 'member__first_name', 'member__last_name', 'member_id') \
+            .values_list('event__title', TruncDate('event__start_date'), *(f'member__{field}' for field in fields))
+        yield from participants.iterator(chunk_size=self.chunk_size)
+
     def export(self, queryset=None, **kwargs):
         """
-        Override export method to export the linked participants instead of the event itself.
-        Will only export linked participants for the first event in the queryset.
-        It only makes sense to export participants for a single event anyway.
+        Override export method to export the linked participants of the events instead of the events themselves.
+        Formats that can be streamed skip this, see exports.StreamingExportMixin.
         """
         if queryset is None:
             return None
 
-        return super().export(queryset.first().participants.all(), **kwargs)
+        rows = self.export_rows(queryset, kwargs.get("export_fields"))
+        dataset = tablib.Dataset(headers=next(rows))
+        for row in rows:
+            dataset.append(row)
+        return dataset
 
 
 class MemberResource(resources.ModelResource):
@@ -40,3 +61,36 @@ class MemberResource(resources.ModelResource):
     class Meta:
         model = m.Member
         import_id_fields = ("id",)
+
+
+class MemberBulkResource(MemberResource):
+    """
+    Member resource for the background imports of whole rosters (see jobs.import_members).
+    The existing members are loaded up front, a chunk of ids at a time, rather than looked up row by row,
+    and rows are written with bulk_create/bulk_update instead of saved one by one.
+    There are no row diffs, and errors are reported per batch, so the admin's interactive import keeps MemberResource.
+    """
+    class Meta:
+        model = m.Member
+        import_id_fields = ("id",)
+        use_bulk = True
+        batch_size = 1000
+        # Rendering a diff of every row is most of the time spent on large imports
+        skip_diff = True
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self.import_columns = set(dataset.headers)
+        pks = [pk for pk in (self.fields["id"].clean(row) for row in dataset.dict) if pk is not None]
+        self.members = {}
+        for start in range(0, len(pks), self._meta.batch_size):
+            self.members.update(m.Member.objects.in_bulk(pks[start:start + self._meta.batch_size]))
+
+    def get_instance(self, instance_loader, row):
+        return self.members.get(self.fields["id"].clean(row))
+
+    def get_bulk_update_fields(self):
+        # Only the columns in the file, bulk_update builds a CASE over every row for each field
+        return [
+            name for name in super().get_bulk_update_fields() if self.fields[name].column_name in self.import_columns
+        ]
@@ -0,0 +1,97 @@
+"""
+Async read path for the API, used when serving through ASGI (settings.ASGI, see gunicorn.conf.py).
+DRF views are sync only, so under ASGI every request to them holds a thread until it is done.
+Viewsets with AsyncReadMixin answer GET list and retrieve requests in an async view instead, reading through
+the async ORM, so that the hot read endpoints keep up however many slow requests (e.g. uploads) are in flight.
+Whatever the async path doesn't cover (writes, paginated lists, other renderers, denied requests)
+is passed on to the regular sync view.
+
+Sync views, including the google login views whose token checks call google, are run by Django on a thread
+made for each request (asgiref's ThreadSensitiveContext), so a slow check only holds up its own request.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotAcceptable, NotFound
+from rest_framework.response import Response
+
+
+class AsyncReadMixin:
+    """
+    Viewset mixin answering list and retrieve in an async view when serving through ASGI.
+    Goes last among the mixins, right before the viewset class, so that the caching mixins wrap it.
+    Lists are not paginated on the async path. StreamingListMixin streams them, as it does on the sync path.
+    """
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASGI or actions.get("get") not in cls.async_actions:
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method in ("GET", "HEAD"):
+                self = cls(**initkwargs)
+                response = await self.async_dispatch(request, actions, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await sync_view(request, *args, **kwargs)
+
+        async_view.cls = cls
+        async_view.initkwargs = initkwargs
+        async_view.actions = actions
+        return csrf_exempt(async_view)
+
+    def use_async_read(self, request):
+        """
+        Whether the async path can answer the request, by default retrieves and unpaginated lists
+        """
+        return self.action == "retrieve" or self.paginator is None
+
+    async def async_dispatch(self, request, actions, *args, **kwargs):
+        """
+        Set the viewset up like APIView.dispatch does, then answer the read.
+        Returns None to leave the request to the sync view.
+        """
+        self.action_map = actions
+        self.action = actions["get"]
+        self.args = args
+        self.kwargs = kwargs
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        self.request = request = self.initialize_request(request, *args, **kwargs)
+        self.headers = self.default_response_headers
+
+        if not self.use_async_read(request):
+            return None
+        # Authenticating the user queries the database, so only requests that are allowed without it are answered
+        if not all(permission.has_permission(request, self) for permission in self.get_permissions()):
+            return None
+        try:
+            request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        except NotAcceptable:
+            return None
+        if request.accepted_renderer.format != "json":
+            return None
+
+        handler = self.alist if self.action == "list" else self.aretrieve
+        try:
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        instances = [instance async for instance in queryset]
+        return Response(self.get_serializer(instances, many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        instance = await queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).afirst()
+        if instance is None:
+            raise NotFound(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instance).data)
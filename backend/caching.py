@@ -0,0 +1,243 @@
+"""
+Version stamps for read-mostly data, used to answer conditional GETs cheaply and to cache rendered responses.
+Each scope's stamp is the time its data last changed. Stamps live in Django's cache
+and are bumped from the model save/delete/m2m signals (see signals.py), or explicitly
+by code that writes through queryset.update()/bulk_update().
+Bumps wait for the writing transaction to commit. A read running before the commit sees the old rows,
+so it must also see the old stamp, or it would tag (and cache) the old rows as the new version.
+"""
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+# Scopes whose data depends on each model
+MODEL_SCOPES = {
+    "backend.Event": ("events",),
+    "backend.ExcoMember": ("exco",),
+    "backend.Family": ("families",),
+    "backend.PhotoSubmission": ("families",),
+}
+
+
+def version_key(scope):
+    return f"version:{scope}"
+
+
+def get_version(scope):
+    """
+    Current version stamp of a scope
+    """
+    version = cache.get(version_key(scope))
+    if version is None:
+        # Nothing recorded (first use, or the cache was cleared), so assume it just changed
+        cache.add(version_key(scope), time.time(), None)
+        version = cache.get(version_key(scope))
+    return version
+
+
+def bump_version(*scopes):
+    """
+    Mark the data of the scopes as changed
+    """
+    now = time.time()
+    cache.set_many({version_key(scope): now for scope in scopes}, None)
+
+
+def bump_model(model):
+    """
+    Mark the data depending on a model as changed, once the current transaction commits
+    """
+    if scopes := MODEL_SCOPES.get(model._meta.label):
+        transaction.on_commit(lambda: bump_version(*scopes))
+
+
+class ConditionalGetMixin:
+    """
+    Viewset mixin that tags list and retrieve responses with an ETag and Last-Modified
+    derived from the version stamps of version_scopes, and answers 304 Not Modified
+    without touching the database when the client already has the current version.
+    Covers the async reads of AsyncReadMixin (asyncviews.py) as well.
+    """
+    version_scopes = ()
+    cache_control = {"public": True, "max_age": 60, "stale_while_revalidate": 300}
+
+    def use_conditional_get(self, request):
+        return True
+
+    def get_validators(self, request):
+        """
+        ETag and last modified time of the current version of the requested resource
+        """
+        versions = [get_version(scope) for scope in self.version_scopes]
+        raw = f"{versions}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        return f'"{hashlib.sha1(raw.encode()).hexdigest()}"', max(versions)
+
+    def check_not_modified(self, request):
+        """
+        Validators of the current version of the requested resource,
+        and a 304 Not Modified response if the client already has that version
+        """
+        etag, last_modified = self.get_validators(request)
+        return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+
+    def tag_response(self, response, etag, last_modified):
+        # Api key holders can get a different body for the same url (e.g. /events/), keep shared caches from mixing them up
+        patch_vary_headers(response, ["Authorization"])
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, **self.cache_control)
+        return response
+
+    def conditional(self, handler, request, *args, **kwargs):
+        if not self.use_conditional_get(request):
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified, response = self.check_not_modified(request)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return self.tag_response(response, etag, last_modified)
+
+    async def aconditional(self, handler, request, *args, **kwargs):
+        if not self.use_conditional_get(request):
+            return await handler(request, *args, **kwargs)
+
+        # Off the event loop, the cache may be in the database
+        etag, last_modified, response = await sync_to_async(self.check_not_modified)(request)
+        if response is None:
+            response = await handler(request, *args, **kwargs)
+        return self.tag_response(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aconditional(super().aretrieve, request, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """
+    Viewset mixin caching the rendered body of JSON list and retrieve responses in Django's cache.
+    Entries are keyed on the version stamps of version_scopes, the url and query parameters,
+    and whether the request came with an api key (since that can change the queryset and serializer).
+    Bumping a stamp therefore invalidates every entry built from the old data.
+    Bodies larger than response_cache_max_bytes are not cached. Streamed ones are cached as they go out,
+    if they turn out small enough.
+    Covers the async reads of AsyncReadMixin (asyncviews.py) as well.
+    """
+    version_scopes = ()
+    response_cache_timeout = 60 * 60 * 24
+    response_cache_max_bytes = 1024 * 1024
+
+    def get_response_cache_timeout(self, request):
+        return self.response_cache_timeout
+
+    def get_response_cache_key(self, request):
+        versions = [get_version(scope) for scope in self.version_scopes]
+        mode = "api" if request.META.get("HTTP_AUTHORIZATION") else "public"
+        query = sorted(request.query_params.lists())
+        # The host is included since paginated responses contain absolute urls
+        raw = f"{versions}|{request.get_host()}{request.path}|{query}|{mode}|{request.accepted_media_type}"
+        return f"response:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def tee_to_cache(self, key, chunks, content_type, timeout):
+        """
+        Pass the chunks of a streamed body through, caching the whole body once it has been sent.
+        Bodies larger than response_cache_max_bytes, or not sent completely, are not cached.
+        """
+        body, size = [], 0
+        for chunk in chunks:
+            if body is not None:
+                size += len(chunk)
+                if size > self.response_cache_max_bytes:
+                    body = None
+                else:
+                    body.append(chunk)
+            yield chunk
+        if body is not None:
+            cache.set(key, (b"".join(body), content_type), timeout)
+
+    async def atee_to_cache(self, key, chunks, content_type, timeout):
+        """
+        Same as tee_to_cache, for bodies streamed from async iterators
+        """
+        body, size = [], 0
+        async for chunk in chunks:
+            if body is not None:
+                size += len(chunk)
+                if size > self.response_cache_max_bytes:
+                    body = None
+                else:
+                    body.append(chunk)
+            yield chunk
+        if body is not None:
+            await cache.aset(key, (b"".join(body), content_type), timeout)
+
+    def cached_response(self, request):
+        """
+        Cache key of the requested response, and the response if it is cached
+        """
+        key = self.get_response_cache_key(request)
+        if entry := cache.get(key):
+            content, content_type = entry
+            return key, HttpResponse(content, content_type=content_type)
+        return key, None
+
+    def store_response(self, key, request, response):
+        if isinstance(response, Response) and response.status_code == 200:
+            # Render now rather than in finalize_response, so the body can be stored
+            response.accepted_renderer = request.accepted_renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            response.render()
+            if len(response.content) <= self.response_cache_max_bytes:
+                cache.set(key, (response.content, response["Content-Type"]), self.get_response_cache_timeout(request))
+        elif isinstance(response, StreamingHttpResponse) and response.status_code == 200:
+            tee = self.atee_to_cache if response.is_async else self.tee_to_cache
+            response.streaming_content = tee(
+                key, response.streaming_content, response["Content-Type"], self.get_response_cache_timeout(request)
+            )
+        return response
+
+    def cached(self, handler, request, *args, **kwargs):
+        # Only JSON is cached, the browsable api renders per-user pages
+        if request.accepted_renderer.format != "json":
+            return handler(request, *args, **kwargs)
+
+        key, response = self.cached_response(request)
+        if response is None:
+            response = self.store_response(key, request, handler(request, *args, **kwargs))
+        return response
+
+    async def acached(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return await handler(request, *args, **kwargs)
+
+        key, response = await sync_to_async(self.cached_response)(request)
+        if response is None:
+            response = await sync_to_async(self.store_response)(key, request, await handler(request, *args, **kwargs))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached(super().aretrieve, request, *args, **kwargs)
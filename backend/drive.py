@@ -0,0 +1,43 @@
+"""
+Google drive access from any thread.
+The drive client is not thread safe, so threads other than the main one each build their own.
+Blocking drive work done for async requests (see asyncviews.py) goes through a bounded pool of threads,
+which caps how many requests can be waiting on google drive at once without tying up the event loop.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.db import connections
+from gdstorage.storage import GoogleDriveStorage
+from . import models as m
+
+_local = threading.local()
+_pool = ThreadPoolExecutor(max_workers=settings.DRIVE_THREADS, thread_name_prefix="drive")
+
+
+def storage():
+    """
+    Google drive storage for the current thread
+    """
+    if threading.current_thread() is threading.main_thread():
+        return m.gd_storage
+    if not hasattr(_local, "storage"):
+        _local.storage = GoogleDriveStorage()
+    return _local.storage
+
+
+def call(func, *args, **kwargs):
+    # Pool threads outlive requests, so the database connection a call opens is closed when it is done
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+async def run(func, *args, **kwargs):
+    """
+    Run a blocking function that calls google drive on the drive pool, and wait for its result
+    """
+    return await asyncio.get_running_loop().run_in_executor(_pool, partial(call, func, *args, **kwargs))
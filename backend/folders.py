@@ -0,0 +1,146 @@
+"""
+Provisioning of the google drive photodump folders of visible events.
+This takes several drive calls, so it is done by a background job (see jobs.py) rather than in Event.save.
+Folders are created in batches under the event_photodumps folder, whose id is cached.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+from . import models as m, caching, drive
+
+PARENT_FOLDER_CACHE_KEY = "event_photodumps_folder_id"
+
+# Google allows up to 100 calls in one batch request
+BATCH_SIZE = 50
+
+
+def folder_name(event):
+    """
+    Name of an event's folder, following the current convention of <Start Date>_<Title>.
+    The date is the local one, events loaded from the database have their start in UTC.
+    """
+    return f'{timezone.localtime(event.start_date).strftime("%Y%m%d")}_{event.title.replace(" ", "_")}'
+
+
+def folder_url(folder_id):
+    return f"https://drive.google.com/drive/folders/{folder_id}"
+
+
+def get_parent_folder_id(refresh=False):
+    """
+    Id of the event_photodumps folder, created if it does not exist yet
+    """
+    folder_id = None if refresh else cache.get(PARENT_FOLDER_CACHE_KEY)
+    if folder_id is None:
+        path = f"{settings.GOOGLE_DRIVE_STORAGE_MEDIA_ROOT}/{settings.GOOGLE_DRIVE_PHOTODUMP_FOLDER}"
+        folder_id = drive.storage()._get_or_create_folder(path)["id"]
+        cache.set(PARENT_FOLDER_CACHE_KEY, folder_id, None)
+    return folder_id
+
+
+def list_child_folders(parent_id):
+    """
+    Map of name to id of the folders directly inside the parent folder
+    """
+    storage = drive.storage()
+    service = storage._drive_service
+    folders = {}
+    page_token = None
+    while True:
+        res = service.files().list(
+            q=f"'{parent_id}' in parents and mimeType = '{storage._GOOGLE_DRIVE_FOLDER_MIMETYPE_}' and trashed = false",
+            fields="nextPageToken, files(id, name)",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute()
+        for file in res.get("files", []):
+            folders.setdefault(file["name"], file["id"])
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            return folders
+
+
+def create_folders(parent_id, names):
+    """
+    Create folders inside the parent folder using batch requests.
+    Returns a map of name to id of the created folders, and a list of the errors for the ones that failed.
+    """
+    storage = drive.storage()
+    service = storage._drive_service
+    created, errors = {}, []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+        else:
+            created[response["name"]] = response["id"]
+
+    for i in range(0, len(names), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for name in names[i:i + BATCH_SIZE]:
+            batch.add(service.files().create(
+                body={
+                    "name": name,
+                    "mimeType": storage._GOOGLE_DRIVE_FOLDER_MIMETYPE_,
+                    "parents": [parent_id],
+                },
+                fields="id, name",
+            ))
+        batch.execute()
+
+    return created, errors
+
+
+def ensure_folders(parent_id, names):
+    """
+    Map of name to id of the folders with the given names inside the parent folder, creating the missing ones,
+    and a list of the errors for the ones that could not be created.
+    Raises the 404 HttpError if the parent folder does not exist.
+    """
+    folders = list_child_folders(parent_id)
+    created, errors = create_folders(parent_id, sorted(names - folders.keys()))
+    for error in errors:
+        if isinstance(error, HttpError) and error.resp.status == 404:
+            raise error
+    folders.update(created)
+    return folders, errors
+
+
+def provision_event_folders():
+    """
+    Create the folders of visible events that do not have one yet, and fill in their urls.
+    Folders that already exist on drive are reused, so this is safe to re-run.
+    Returns the number of events updated.
+    """
+    events = list(
+        m.Event.objects.filter(visible=True)
+        .filter(Q(event_image_folder_url__isnull=True) | Q(event_image_folder_url=""))
+        .only("id", "title", "start_date")
+    )
+    if not events:
+        return 0
+
+    names = {folder_name(event) for event in events}
+    try:
+        folders, errors = ensure_folders(get_parent_folder_id(), names)
+    except HttpError as e:
+        # The cached parent folder was removed from drive
+        if e.resp.status != 404:
+            raise
+        folders, errors = ensure_folders(get_parent_folder_id(refresh=True), names)
+
+    provisioned = []
+    for event in events:
+        if folder_id := folders.get(folder_name(event)):
+            event.event_image_folder_url = folder_url(folder_id)
+            provisioned.append(event)
+    m.Event.objects.bulk_update(provisioned, ["event_image_folder_url"])
+    caching.bump_model(m.Event)
+
+    # Keep what went through and let the job be retried for the rest
+    if errors:
+        raise RuntimeError(f"Failed to create {len(errors)} event folders: {errors[0]}")
+
+    return len(provisioned)
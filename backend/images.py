@@ -0,0 +1,231 @@
+"""
+Resized copies of google drive images, served by the image proxy view.
+The original is downloaded from google drive once, every variant is rendered from it with Pillow,
+and the results are kept in a size-bounded on-disk LRU cache.
+Also prepares uploaded images before they are sent to google drive, see normalize.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from django.conf import settings
+from django.http import Http404
+from googleapiclient.http import MediaIoBaseDownload
+from PIL import Image, ImageOps
+from . import models as m, drive
+
+# Longest edge in pixels of each variant, None keeps the original size
+VARIANTS = {
+    "thumb": 320,
+    "medium": 1024,
+    "full": None,
+}
+
+# Pillow format name and content type of each output format
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+QUALITY = 80
+
+# Bump when the rendering changes, so that clients drop variants cached under the old etags
+RENDER_VERSION = 1
+
+
+class ImageCache:
+    """
+    Directory of rendered variants, evicting the least recently used files once it grows past max_bytes.
+    Recency is tracked through the file modification times, which are bumped on every hit.
+    Rather than scanning the directory on every write, its size is estimated by adding up what was written
+    since the last scan, and it is only scanned again once the estimate crosses max_bytes.
+    Other processes write to the same directory, so the estimate is also refreshed every rescan_interval seconds.
+    """
+    rescan_interval = 300
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = None  # estimated size of the directory in bytes, None until it is scanned
+        self.scanned_at = 0
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """
+        Path of the cached file, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """
+        Atomically write a file into the cache, then evict if it grew too large
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=".", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, self.path(key))
+
+        with self.lock:
+            if self.size is not None:
+                self.size += len(data)
+            if self.size is None or self.size > self.max_bytes or time.monotonic() - self.scanned_at > self.rescan_interval:
+                self.evict()
+
+    def evict(self):
+        """
+        Scan the directory, and remove the least recently used files until the cache is back under 90% of max_bytes
+        """
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes * 0.9:
+                    break
+        self.size, self.scanned_at = total, time.monotonic()
+
+
+_caches = {}
+
+
+def get_cache():
+    """
+    The image cache of this process, shared so that its size estimate carries over between requests
+    """
+    root, max_bytes = settings.IMAGE_CACHE_ROOT, settings.IMAGE_CACHE_MAX_BYTES
+    return _caches.setdefault((root, max_bytes), ImageCache(root, max_bytes))
+
+
+def cache_key(image_id, variant, fmt):
+    return f"{image_id}-{variant}.{fmt}"
+
+
+def etag(image_id, variant, fmt):
+    """
+    Strong etag of a variant. Rendering is deterministic, so it only depends on what is being rendered.
+    """
+    digest = hashlib.sha1(f"{cache_key(image_id, variant, fmt)}-{RENDER_VERSION}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def is_known_image(image_id):
+    """
+    Only images referenced by our own models are proxied,
+    so the endpoint can't be used to read arbitrary files the service account has access to
+    """
+    return (
+        m.Event.objects.filter(image_id=image_id).exists()
+        or m.PhotoSubmission.objects.filter(image_id=image_id).exists()
+        or m.ExcoMember.objects.filter(photo_id=image_id).exists()
+        or m.ExcoMember.objects.filter(alt_photo_id=image_id).exists()
+    )
+
+
+def download_original(image_id, service=None):
+    """
+    Download an image from google drive, through the current thread's drive service unless another is given
+    """
+    service = service or drive.storage()._drive_service
+    request = service.files().get_media(fileId=image_id)
+    buffer = BytesIO()
+    downloader = MediaIoBaseDownload(buffer, request)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    return buffer.getvalue()
+
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def render_variants(data, fmt):
+    """
+    Render every variant of an image in the given format. Returns a dict of variant name to bytes.
+    """
+    pil_format, _ = FORMATS[fmt]
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if has_alpha(image) and fmt == "webp" else "RGB")
+
+    rendered = {}
+    for variant, max_edge in VARIANTS.items():
+        resized = image.copy()
+        if max_edge:
+            resized.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, format=pil_format, quality=QUALITY)
+        rendered[variant] = buffer.getvalue()
+    return rendered
+
+
+def normalize(data, max_edge=None, quality=QUALITY):
+    """
+    Prepare an uploaded image for google drive: apply its EXIF orientation, drop its metadata (EXIF, GPS etc.),
+    scale it down so that its longest edge is at most max_edge, and re-encode it.
+    Images with transparency are saved as PNG, everything else as JPEG at the given quality.
+    Returns the new bytes and their file extension. Animations are returned as they are, with no extension.
+    """
+    with Image.open(BytesIO(data)) as original:
+        if getattr(original, "is_animated", False):
+            return data, None
+        icc_profile = original.info.get("icc_profile")
+        image = ImageOps.exif_transpose(original)
+        alpha = has_alpha(image)
+        image = image.convert("RGBA" if alpha else "RGB")
+
+    if max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = BytesIO()
+    # Only the colour profile is carried over, the rest of the metadata is dropped by not passing it on
+    if alpha:
+        image.save(buffer, format="PNG", optimize=True, icc_profile=icc_profile)
+        return buffer.getvalue(), ".png"
+    image.save(buffer, format="JPEG", quality=quality, optimize=True, icc_profile=icc_profile)
+    return buffer.getvalue(), ".jpg"
+
+
+def open_cached_variant(image_id, variant, fmt):
+    """
+    Open the cached variant of an image, or return None if it has not been rendered yet
+    """
+    if path := get_cache().get(cache_key(image_id, variant, fmt)):
+        return open(path, "rb")
+    return None
+
+
+def render_variant(image_id, variant, fmt):
+    """
+    Download an image and render its variants into the cache, returning the requested one
+    """
+    if not is_known_image(image_id):
+        raise Http404("Unknown image")
+
+    # Render every variant from the one download, they are usually requested together.
+    # The requested one is written last so that it is the last to be evicted.
+    cache = get_cache()
+    rendered = render_variants(download_original(image_id), fmt)
+    for name in sorted(rendered, key=lambda name: name == variant):
+        cache.put(cache_key(image_id, name, fmt), rendered[name])
+    return BytesIO(rendered[variant])
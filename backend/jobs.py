@@ -0,0 +1,207 @@
+"""
+Minimal database-backed job queue.
+Jobs are rows in the Job table. `manage.py run_jobs` claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED,
+so several workers can run side by side, and retries failed jobs with exponential backoff.
+A worker can also run the jobs it claims on a pool of threads, e.g. to upload several images to google drive at once.
+Handlers are registered below with the @handler decorator, keyed on Job.kind.
+"""
+import logging
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+import tablib
+from import_export.formats import base_formats
+from PIL import UnidentifiedImageError
+from . import models as m, folders, caching, images, drive
+from .admin import resources
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 6
+RETRY_DELAY = timedelta(seconds=30)  # doubled after every failed attempt
+LEASE = timedelta(minutes=10)  # a running job not finished within this is assumed lost and retried
+IMPORT_CHUNK_SIZE = 1000  # rows imported per transaction by import jobs
+
+HANDLERS = {}
+
+
+class PermanentError(Exception):
+    """
+    Raised by handlers for failures that retrying would not fix, so the job is marked failed straight away
+    """
+
+
+def handler(kind):
+    """
+    Register the decorated function as the handler for jobs of this kind
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def claim(limit=1):
+    """
+    Claim up to `limit` due jobs, marking them as running
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            m.Job.objects
+            .filter(status__in=("pending", "running"), run_after__lte=now)
+            .order_by("run_after", "id")
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        m.Job.objects.filter(pk__in=[job.pk for job in jobs]) \
+            .update(status="running", run_after=now + LEASE, attempts=F("attempts") + 1)
+    for job in jobs:
+        job.status = "running"
+        job.attempts += 1
+    return jobs
+
+
+def run(job):
+    """
+    Run a claimed job, then mark it done or schedule a retry
+    """
+    try:
+        HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.exception("Job %s failed", job)
+        failed = isinstance(e, PermanentError) or job.attempts >= MAX_ATTEMPTS
+        m.Job.objects.filter(pk=job.pk).update(
+            status="failed" if failed else "pending",
+            run_after=timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1),
+            last_error=traceback.format_exc(),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    # Staged data is no longer needed once the job has gone through
+    m.Job.objects.filter(pk=job.pk).update(status="done", data=None, last_error="", updated_at=timezone.now())
+    return True
+
+
+def run_in_thread(job):
+    """
+    Run a claimed job on a pool thread, closing the database connection the thread opened for it
+    """
+    try:
+        return run(job)
+    finally:
+        connections.close_all()
+
+
+def worker_pool(concurrency):
+    """
+    Thread pool for a worker to run `concurrency` jobs at a time on, or None to run them one by one.
+    Made once per worker and passed to every run_pending, so that the threads keep their drive clients
+    (see drive.storage), which take a few calls to google to set up.
+    """
+    return ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="jobs") if concurrency > 1 else None
+
+
+def run_pending(limit=10, pool=None):
+    """
+    Claim and run up to `limit` due jobs, on `pool` if given (see worker_pool). Returns the number of jobs claimed.
+    """
+    jobs = claim(limit)
+    if pool is not None and len(jobs) > 1:
+        list(pool.map(run_in_thread, jobs))
+    else:
+        for job in jobs:
+            run(job)
+    return len(jobs)
+
+
+################
+##  Handlers  ##
+################
+
+@handler("upload_image")
+def upload_image(job):
+    """
+    Upload an image staged by CachedImageModel.save to google drive and cache its id on the row.
+    The image is normalized first, following the model's image_normalization.
+    """
+    model = apps.get_model(job.payload["model"])
+    name = job.payload["name"]
+    row = model.objects.filter(pk=job.payload["pk"], image=name)
+
+    # The row was deleted or given another image before we got to it
+    if not row.exists():
+        return
+
+    data = original = bytes(job.data)
+    if model.image_normalization is not None:
+        try:
+            data, ext = images.normalize(original, **model.image_normalization)
+        except UnidentifiedImageError:
+            logger.warning("Could not normalize %s, uploading it as received", name)
+        else:
+            if ext is not None:
+                name = os.path.splitext(name)[0] + ext
+
+    storage = drive.storage()
+    stored_name = storage.save(name, ContentFile(data, name=name))
+    url = storage.url(stored_name)
+    if url is None:
+        raise RuntimeError(f"Uploaded {stored_name} but could not find it on google drive")
+
+    row.update(
+        image=stored_name,
+        image_id=m.get_image_id(url),
+        image_original_size=len(original),
+        image_size=len(data),
+    )
+    caching.bump_model(model)
+
+
+@handler("provision_event_folders")
+def provision_event_folders(job):
+    """
+    Create the drive folders of visible events queued by Event.save
+    """
+    folders.provision_event_folders()
+
+
+def import_errors(result, offset):
+    """
+    Summary of the errors of an import result, with row numbers counted from the start of the file
+    """
+    lines = [str(error.error) for error in result.base_errors]
+    lines += [f"Row {offset + number}: {error.error}" for number, errors in result.row_errors() for error in errors]
+    lines += [f"Row {offset + row.number}: {row.error_dict}" for row in result.invalid_rows]
+    return "\n".join(lines)
+
+
+@handler("import_members")
+def import_members(job):
+    """
+    Import a member roster staged by the member admin's background import, a chunk of rows per transaction.
+    The progress is saved along with each chunk, so a retried job carries on after the last imported chunk,
+    and the job's lease is extended with it, so that a long import is not taken for lost and run twice.
+    A chunk with invalid rows is rolled back and fails the job for good, with the errors in its last error.
+    """
+    file_format = getattr(base_formats, job.payload["format"])()
+    data = bytes(job.data)
+    dataset = file_format.create_dataset(data if file_format.is_binary() else data.decode("utf-8-sig"))
+    m.Job.objects.filter(pk=job.pk).update(total=len(dataset))
+
+    resource = resources.MemberBulkResource()
+    for start in range(job.progress, len(dataset), IMPORT_CHUNK_SIZE):
+        chunk = tablib.Dataset(*dataset[start:start + IMPORT_CHUNK_SIZE], headers=dataset.headers)
+        with transaction.atomic():
+            result = resource.import_data(chunk, raise_errors=False)
+            if result.has_errors() or result.has_validation_errors():
+                raise PermanentError(f"Import failed, no rows from row {start + 1} on were imported:\n"
+                                     + import_errors(result, start))
+            now = timezone.now()
+            m.Job.objects.filter(pk=job.pk).update(progress=start + len(chunk), run_after=now + LEASE, updated_at=now)
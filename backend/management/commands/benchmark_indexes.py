@@ -0,0 +1,99 @@
+import random
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from backend import models as m
+
+# Models whose Meta.indexes are benchmarked
+MODELS = (m.Event, m.PhotoSubmission)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and print the query plans of the event and photo submission access paths "
+        "without and with their indexes. Everything is rolled back afterwards, but the tables are locked "
+        "while it runs, so use a local or staging database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=20000, help="Number of events to seed")
+        parser.add_argument("--submissions", type=int, default=200000, help="Number of photo submissions to seed")
+
+    def queries(self, family):
+        now = timezone.now()
+        return {
+            "Public event list": m.Event.objects.filter(visible=True).order_by("-start_date"),
+            "Telebot event window": m.Event.objects
+                .filter(visible=True, start_date__gte=now - timedelta(days=365), start_date__lte=now)
+                .order_by("-start_date", "-id")[:20],
+            "Family points": m.PhotoSubmission.objects.filter(family=family).values("family").annotate(Sum("score")),
+            "Unvetted submissions": m.PhotoSubmission.objects.filter(vetted=False).order_by("-date_uploaded")[:100],
+        }
+
+    def seed(self, n_events, n_submissions):
+        now = timezone.now()
+        families = m.Family.objects.bulk_create(m.Family(fam_name=f"Benchmark {i}") for i in range(8))
+        m.Event.objects.bulk_create(
+            (
+                m.Event(
+                    title=f"Benchmark {i}",
+                    start_date=now - timedelta(days=random.uniform(-365, 365 * 10)),
+                    venue="Benchmark",
+                    visible=random.random() < 0.3,
+                )
+                for i in range(n_events)
+            ),
+            batch_size=5000,
+        )
+        m.PhotoSubmission.objects.bulk_create(
+            (
+                m.PhotoSubmission(
+                    family=random.choice(families),
+                    score=random.randint(0, 100),
+                    description="random",
+                    vetted=random.random() < 0.9,
+                )
+                for _ in range(n_submissions)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            # Run the deferred foreign key checks now, postgres won't alter tables with pending ones
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        self.analyze()
+        return families[0]
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            for model in MODELS:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+    def explain(self, family):
+        for name, queryset in self.queries(family).items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(analyze=True))
+            self.stdout.write("")
+
+    def handle(self, *args, events, submissions, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {events} events and {submissions} photo submissions")
+            family = self.seed(events, submissions)
+
+            with connection.schema_editor() as editor:
+                for model in MODELS:
+                    for index in model._meta.indexes:
+                        editor.remove_index(model, index)
+            self.stdout.write(self.style.SUCCESS("Without indexes\n"))
+            self.explain(family)
+
+            with connection.schema_editor() as editor:
+                for model in MODELS:
+                    for index in model._meta.indexes:
+                        editor.add_index(model, index)
+            self.analyze()
+            self.stdout.write(self.style.SUCCESS("With indexes\n"))
+            self.explain(family)
+
+            transaction.set_rollback(True)
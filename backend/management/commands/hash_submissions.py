@@ -0,0 +1,77 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from googleapiclient.errors import HttpError
+from PIL import UnidentifiedImageError
+from backend import models as m, images, drive, phash
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the perceptual hashes of photo submissions made before submissions were hashed, "
+        "downloading the images from google drive in parallel, then flag the duplicates among them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Number of images to download at the same time")
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of hashes to save per query")
+
+    def hash_image(self, submission):
+        pk, image_id = submission
+        try:
+            # Each pool thread has its own drive client, they are not thread safe
+            data = images.download_original(image_id, drive.storage()._drive_service)
+            return pk, phash.dhash(data)
+        except (HttpError, UnidentifiedImageError) as e:
+            self.stderr.write(f"Could not hash submission {pk}: {e}")
+            return pk, None
+
+    def flag_duplicates(self, hashed):
+        """
+        Point each of the newly hashed submissions at the earliest submission of the same photo before it.
+        Submissions that were already hashed are left alone, admins may have cleared their flags.
+        """
+        rows = m.PhotoSubmission.objects.filter(image_hash__isnull=False).order_by("id") \
+            .values_list("id", "image_hash", "duplicate_of_id")
+        seen = defaultdict(list)  # (chunk number, chunk) -> earlier rows with that chunk
+        flagged = []
+        for pk, image_hash, duplicate_of in rows.iterator():
+            chunks = list(enumerate(phash.chunks(image_hash)))
+            if pk in hashed and duplicate_of is None:
+                matches = [
+                    other for key in chunks for other in seen[key]
+                    if phash.distance(image_hash, other[1]) <= phash.MAX_DISTANCE
+                ]
+                if matches:
+                    first_pk, _, first_duplicate_of = min(matches)
+                    duplicate_of = first_duplicate_of or first_pk
+                    flagged.append(m.PhotoSubmission(pk=pk, duplicate_of_id=duplicate_of))
+            for key in chunks:
+                seen[key].append((pk, image_hash, duplicate_of))
+
+        m.PhotoSubmission.objects.bulk_update(flagged, ["duplicate_of"], batch_size=1000)
+        return len(flagged)
+
+    def handle(self, *args, workers=8, batch_size=100, **options):
+        pending = list(
+            m.PhotoSubmission.objects.filter(image_hash__isnull=True)
+            .exclude(image_id__isnull=True).exclude(image_id="")
+            .order_by("id").values_list("id", "image_id")
+        )
+        self.stdout.write(f"Hashing {len(pending)} submissions")
+
+        hashed, batch = set(), []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for pk, image_hash in pool.map(self.hash_image, pending):
+                if image_hash is None:
+                    continue
+                hashed.add(pk)
+                batch.append(m.PhotoSubmission(pk=pk, image_hash=image_hash))
+                if len(batch) >= batch_size:
+                    m.PhotoSubmission.objects.bulk_update(batch, ["image_hash"])
+                    self.stdout.write(f"Hashed {len(hashed)}/{len(pending)}")
+                    batch = []
+        m.PhotoSubmission.objects.bulk_update(batch, ["image_hash"])
+
+        flagged = self.flag_duplicates(hashed)
+        self.stdout.write(self.style.SUCCESS(f"Hashed {len(hashed)} submissions, {flagged} suspected duplicates"))
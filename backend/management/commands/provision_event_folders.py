@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from backend import folders
+
+
+class Command(BaseCommand):
+    help = "Create the google drive photodump folders of every visible event that does not have one yet"
+
+    def handle(self, *args, **options):
+        count = folders.provision_event_folders()
+        self.stdout.write(self.style.SUCCESS(f"Provisioned folders for {count} events"))
@@ -0,0 +1,35 @@
+from math import isclose
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from backend import models as m, caching
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored family points from the photo submissions and check them against the live aggregate"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the stored points against the live aggregate, without rebuilding",
+        )
+
+    def handle(self, *args, check=False, **options):
+        with transaction.atomic():
+            if not check:
+                count = m.Family.objects.rebuild_points()
+                caching.bump_model(m.Family)
+                self.stdout.write(f"Rebuilt points for {count} families")
+
+            mismatches = [
+                family for family in m.Family.objects.with_live_points().order_by("id")
+                if not isclose(family.points, family.live_points, abs_tol=1e-6)
+            ]
+
+        for family in mismatches:
+            self.stdout.write(f"{family} (id {family.id}): stored {family.points}, live {family.live_points}")
+
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} families do not match the live aggregate")
+
+        self.stdout.write(self.style.SUCCESS("Stored points match the live aggregate"))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from backend import models as m, caching
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate the scores of photo submissions with a version of the scoring rules (the latest by default), "
+        "in the database, then rebuild the family points. Scores entered by hand are kept unless --include-manual is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rules-version", type=int, help="Version of the scoring rules to use")
+        parser.add_argument("--include-manual", action="store_true", help="Also recalculate scores that were entered by hand")
+        parser.add_argument("--dry-run", action="store_true", help="Only report the change to each family's points")
+        parser.add_argument("--chunk-size", type=int, default=20000, help="Number of submission ids updated per query")
+
+    def report(self, submissions, score):
+        """
+        Print the change to each family's points rescoring would make. Returns the number of submissions that change.
+        """
+        families = dict(m.Family.objects.values_list("id", "fam_name"))
+        totals = submissions.values("family").annotate(old=Sum("score"), new=Sum(score)).order_by("family")
+        for total in totals:
+            delta = (total["new"] or 0) - (total["old"] or 0)
+            name = families.get(total["family"], "(no family)")
+            self.stdout.write(f"{name}: {total['old'] or 0:g} -> {total['new'] or 0:g} ({delta:+g})")
+        return submissions.exclude(score=score).count()
+
+    def handle(self, *args, rules_version=None, include_manual=False, dry_run=False, chunk_size=20000, **options):
+        if rules_version is None:
+            rules_version = m.ScoringRule.objects.aggregate(latest=Max("version"))["latest"]
+        if rules_version is None or not m.ScoringRule.objects.filter(version=rules_version).exists():
+            raise CommandError(f"There are no scoring rules with version {rules_version}")
+
+        score = m.ScoringRule.objects.score_expression(rules_version)
+        submissions = m.PhotoSubmission.objects.all()
+        if not include_manual:
+            submissions = submissions.filter(scoring_version__isnull=False)
+
+        with transaction.atomic():
+            changed = self.report(submissions, score)
+            if dry_run:
+                self.stdout.write(f"{changed} submissions would be rescored with version {rules_version} (dry run)")
+                return
+
+            # Update in id ranges, to keep each statement short
+            bounds = submissions.aggregate(first=Min("id"), last=Max("id"))
+            if bounds["first"] is not None:
+                for start in range(bounds["first"], bounds["last"] + 1, chunk_size):
+                    submissions.filter(id__gte=start, id__lt=start + chunk_size) \
+                        .update(score=score, scoring_version=rules_version)
+
+            m.Family.objects.rebuild_points()
+            # Updates bypass the signals that normally invalidate cached responses
+            caching.bump_model(m.PhotoSubmission)
+
+        self.stdout.write(self.style.SUCCESS(f"Rescored {changed} submissions with version {rules_version}"))
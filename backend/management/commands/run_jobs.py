@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from backend import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (google drive uploads etc.)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no more due jobs instead of polling forever",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2,
+            help="Seconds to wait between polls when the queue is empty",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of jobs to run at the same time, e.g. image uploads to google drive",
+        )
+
+    def handle(self, *args, once=False, poll_interval=2, concurrency=1, **options):
+        pool = jobs.worker_pool(concurrency)
+        try:
+            while True:
+                close_old_connections()
+                if jobs.run_pending(limit=max(10, concurrency * 2), pool=pool):
+                    continue
+                if once:
+                    break
+                time.sleep(poll_interval)
+        finally:
+            if pool is not None:
+                pool.shutdown()
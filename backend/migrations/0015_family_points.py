@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:06
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_points(apps, schema_editor):
+    """
+    Fill in the new points column from the existing submissions
+    """
+    Family = apps.get_model('backend', 'Family')
+    PhotoSubmission = apps.get_model('backend', 'PhotoSubmission')
+    submission_points = PhotoSubmission.objects.filter(family=models.OuterRef('pk')) \
+        .values('family').annotate(total=models.Sum('score')).values('total')
+    Family.objects.update(points=Coalesce(models.Subquery(submission_points), 0.0) + models.F('points_adjustment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_alter_excomember_major_alter_excomember_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='family',
+            name='points',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_points, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:14
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Stop before adding the constraint if usernames differ only in case, listing the members to fix by hand
+    """
+    Member = apps.get_model('backend', 'Member')
+    members = {}
+    for member_id, username in Member.objects.filter(telegram_username__isnull=False) \
+            .annotate(username=Lower('telegram_username')).order_by('id').values_list('id', 'username'):
+        members.setdefault(username, []).append(member_id)
+    duplicates = {username: ids for username, ids in members.items() if len(ids) > 1}
+    if duplicates:
+        conflicts = '; '.join(f'{username}: members {", ".join(map(str, ids))}' for username, ids in sorted(duplicates.items()))
+        raise RuntimeError(
+            f'Telegram usernames are about to become case insensitive, but some are shared by several members ({conflicts}). '
+            'Rename or clear all but one of each, then migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='member',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('telegram_username'), name='member_telegram_username_lower_unique', violation_error_message='A member with this telegram username already exists (usernames are case insensitive).'),
+        ),
+    ]
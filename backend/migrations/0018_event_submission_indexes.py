@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_member_telegram_username_lower_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('visible', True)), fields=['start_date', 'id'], name='event_visible_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(fields=['family', 'score'], name='submission_family_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(fields=['vetted', '-date_uploaded'], name='submission_vetted_date_idx'),
+        ),
+    ]
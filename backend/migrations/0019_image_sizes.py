@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_event_submission_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image_original_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Image size as uploaded (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Image size on google drive (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='photosubmission',
+            name='image_original_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Image size as uploaded (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='photosubmission',
+            name='image_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Image size on google drive (bytes)'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:23
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_image_sizes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photosubmission',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='backend.photosubmission', verbose_name='Suspected duplicate of (clear if not a duplicate)'),
+        ),
+        migrations.AddField(
+            model_name='photosubmission',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Perceptual hash of the image'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('image_hash'), '>>', models.Value(0)), '&', models.Value(65535)), name='submission_hash_chunk_0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('image_hash'), '>>', models.Value(16)), '&', models.Value(65535)), name='submission_hash_chunk_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('image_hash'), '>>', models.Value(32)), '&', models.Value(65535)), name='submission_hash_chunk_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photosubmission',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('image_hash'), '>>', models.Value(48)), '&', models.Value(65535)), name='submission_hash_chunk_3_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+# (description, per_person, people_offset, base) of the rules as they were hard coded in PhotoSubmission.calculate_score
+INITIAL_RULES = [
+    ("ssa", 10, 0, 0),
+    ("random", 2, 1, 0),
+    ("fun", 5, 1, 0),
+    ("single", 5, 1, 10),
+    ("crossover", 5, 1, 30),
+]
+
+
+def seed_rules(apps, schema_editor):
+    """
+    Store the current scoring rules as version 1, and mark the submissions whose score they give as calculated with it.
+    Other scores were entered by hand, so they are left without a version.
+    """
+    ScoringRule = apps.get_model('backend', 'ScoringRule')
+    PhotoSubmission = apps.get_model('backend', 'PhotoSubmission')
+    ScoringRule.objects.bulk_create(
+        ScoringRule(version=1, description=description, per_person=per_person, people_offset=people_offset, base=base)
+        for description, per_person, people_offset, base in INITIAL_RULES
+    )
+    calculated = models.Case(
+        *(
+            models.When(
+                description=description,
+                then=models.ExpressionWrapper(
+                    models.Value(float(per_person)) * (models.F('number_of_people') - people_offset) + models.Value(float(base)),
+                    output_field=models.FloatField(),
+                ),
+            )
+            for description, per_person, people_offset, base in INITIAL_RULES
+        ),
+        default=models.Value(0.0),
+        output_field=models.FloatField(),
+    )
+    PhotoSubmission.objects.filter(score=calculated).update(scoring_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_submission_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photosubmission',
+            name='scoring_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Version of the scoring rules the score was calculated with (empty if entered by hand)'),
+        ),
+        migrations.CreateModel(
+            name='ScoringRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('description', models.CharField(choices=[('random', 'On-campus random encounter'), ('fun', 'On-campus fun event'), ('single', 'Off-campus single fam event'), ('crossover', 'Off-campus crossover fam event'), ('ssa', 'SSA-wide event')])),
+                ('per_person', models.FloatField(default=0)),
+                ('people_offset', models.IntegerField(default=0, help_text='Number of people not counted, e.g. 1 for the photographer')),
+                ('base', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('version', 'description'), name='scoring_rule_version_description_unique')],
+            },
+        ),
+        migrations.RunPython(seed_rules, migrations.RunPython.noop),
+    ]
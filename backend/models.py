@@ -1,9 +1,16 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
 from gdstorage.storage import GoogleDriveStorage
 from django.conf import settings
+from PIL import UnidentifiedImageError
+from . import phash
 
-__all__ = ['Event', 'Member', 'Family', 'PhotoSubmission']
+__all__ = ['Event', 'Member', 'Family', 'ScoringRule', 'PhotoSubmission', 'Job']
 
 gd_storage = GoogleDriveStorage()
 
@@ -39,8 +46,29 @@ def get_upload_path(instance, filename):
     return f"{instance.__class__.__name__.lower()}_images/{filename}"
 
 
-def img_url_from_id(id):
-    return f"https://lh3.googleusercontent.com/u/0/d/{id}" if id else None
+def img_url_from_id(id, variant=None):
+    """
+    Url of a google drive image.
+    If a variant is given (see backend/images.py), the url of a resized copy served by the image proxy instead.
+    """
+    if not id:
+        return None
+    if variant:
+        return settings.PUBLIC_URL + reverse("image-variant", args=[id, variant])
+    return f"https://lh3.googleusercontent.com/u/0/d/{id}"
+
+@models.CharField.register_lookup
+class LowerExact(models.Lookup):
+    """
+    Case insensitive exact match, compiled to LOWER(field) = LOWER(value) so that it can be
+    served by functional indexes on Lower(field). The builtin iexact compiles to UPPER() on postgres.
+    """
+    lookup_name = 'lower_exact'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"LOWER({lhs}) = LOWER({rhs})", (*lhs_params, *rhs_params)
 
 ###############################
 ##  Model class definitions  ##
@@ -48,10 +76,22 @@ def img_url_from_id(id):
 
 class CachedImageModel(models.Model):
     """
-    Abstract base class for models that have an image field
+    Abstract base class for models that have an image field.
+    Field values are snapshotted when an instance is loaded, so that saves can tell what changed
+    and write only the changed columns in a single UPDATE.
     """
     image_id = models.CharField(blank=True, null=True, verbose_name="Image id (do not edit)")
     image = models.ImageField(blank=True, null=True, upload_to=get_upload_path, storage=gd_storage)
+    image_original_size = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Image size as uploaded (bytes)")
+    image_size = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Image size on google drive (bytes)")
+
+    # How uploaded images are prepared before they are sent to google drive, see images.normalize.
+    # max_edge is the longest edge in pixels (None keeps the full resolution), quality the JPEG quality.
+    # Set to None to upload images exactly as received.
+    image_normalization = {"max_edge": 2048, "quality": 85}
+
+    # Concrete field values as last read from or written to the database, keyed on attname
+    _loaded_values = None
 
     class Meta:
         abstract = True
@@ -60,27 +100,127 @@ class CachedImageModel(models.Model):
     def image_url(self):
         return img_url_from_id(self.image_id)
 
+    @property
+    def image_thumb_url(self):
+        return img_url_from_id(self.image_id, "thumb")
+
+    @property
+    def image_medium_url(self):
+        return img_url_from_id(self.image_id, "medium")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """
+        Overridden so that the reloaded values become the database state saves are diffed against
+        """
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or self._loaded_values is None:
+            self._take_snapshot()
+        else:
+            # Only the refreshed fields, the others may have unsaved changes
+            self._take_snapshot({self._meta.get_field(name).attname for name in fields})
+
+    def _take_snapshot(self, attnames=None):
+        """
+        Record the current (non-deferred) field values as the database state.
+        Only the fields in attnames if given, leaving the rest of the snapshot as it was.
+        """
+        if attnames is None:
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (attnames is None or field.attname in attnames):
+                value = getattr(self, field.attname)
+                # Snapshot the name of files, the FieldFile itself may be mutated in place
+                if isinstance(value, FieldFile):
+                    value = value.name
+                self._loaded_values[field.attname] = value
+
+    def get_changed_fields(self):
+        """
+        Names of the fields that differ from the snapshot, i.e. the columns a save has to write
+        """
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__ and (
+                getattr(field, 'auto_now', False)
+                or field.attname not in self._loaded_values
+                or getattr(self, field.attname) != self._loaded_values[field.attname]
+            )
+        ]
+
     def save(self, *args, **kwargs):
         """
         Overridden save method.
-        Handles the saving of the image to google drive and the generation of the image_id field.
+        A newly assigned image is not uploaded to google drive here, since that blocks the request for the
+        whole drive round-trip. Its bytes are staged in an upload job instead and the row is saved with
+        image_id cleared. The job worker (`manage.py run_jobs`) uploads it and fills in image_id.
+        Existing rows loaded from the database only have their changed columns written.
         """
         # Check if we're updating or creating the an image
-        try:
-            prev_image = self.__class__.objects.get(pk=self.pk).image
-        except self.__class__.DoesNotExist:
+        if self._state.adding:
             prev_image = None
-
-        # Call the parent save method. This also saves the image to google drive
-        super().save(*args, **kwargs)
-
-        # If the image has changed, cache the id of the new image
-        if self.image != prev_image:
+        elif self._loaded_values is not None and 'image' in self._loaded_values:
+            prev_image = self._loaded_values['image']
+        else:
+            # Not loaded from the database (or image deferred), so there is nothing to compare against
+            prev_image = self.__class__.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+
+        staged_data = self.stage_image()
+        if staged_data is None and self.image != prev_image:
+            # The image was cleared or pointed at another existing file, cache the id of the new image
             try:
                 self.image_id = get_image_id(self.image.url)
             except ValueError:
                 self.image_id = None
-            super().save(update_fields=['image_id'])
+
+        # Rows without a pk are inserted, e.g. copies made by clearing the pk of a loaded row
+        updating = not self._state.adding and self.pk is not None and not kwargs.get('force_insert')
+        if updating and self._loaded_values is not None and kwargs.get('update_fields') is None:
+            # An empty list makes the save a no-op
+            kwargs['update_fields'] = self.get_changed_fields()
+
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+            if staged_data is not None:
+                self.upload_job(staged_data).save()
+
+        self._take_snapshot()
+
+    def stage_image(self):
+        """
+        Take the bytes of a newly assigned image off the upload, and store the path it will be uploaded to,
+        marking the file as committed so the storage backend is not called on save.
+        Returns the bytes, or None if the image is not new.
+        """
+        upload = self.take_upload()
+        return None if upload is None else b"".join(upload.chunks())
+
+    def take_upload(self):
+        """
+        Same as stage_image, returning the uploaded file rather than reading it
+        """
+        if not self.image or self.image._committed:
+            return None
+        upload = self.image.file
+        self.image = self.image.field.generate_filename(self, self.image.name)
+        self.image_id = None
+        return upload
+
+    def upload_job(self, data):
+        """
+        Unsaved job uploading the staged image of this row
+        """
+        return Job(
+            kind="upload_image",
+            payload={"model": self._meta.label, "pk": self.pk, "name": self.image.name},
+            data=data,
+        )
 
 
 class Event(CachedImageModel):
@@ -97,30 +237,31 @@ class Event(CachedImageModel):
     visible = models.BooleanField(default=False, verbose_name="Event visibility on telebot and website (if set to true, a new folder will be created on the drive for uploading event images)")
     event_image_folder_url = models.URLField(blank=True, null=True)
 
+    # Banners are shown full width on the website, so keep their full resolution
+    image_normalization = {"max_edge": None, "quality": 90}
+
+    class Meta:
+        indexes = [
+            # The website and telebot only ever list visible events, newest first and/or within a date window
+            models.Index(fields=['start_date', 'id'], condition=models.Q(visible=True), name='event_visible_start_idx'),
+        ]
+
     def __str__(self):
         return self.title
     
     def save(self, *args, **kwargs):
         """
         Overwrite the regular save method so that a gdrive folder 
-        can be created everytime a new event is created
+        can be created everytime a new event is created.
+        Creating the folder takes several drive calls, so it is left to a background job
+        (see backend/folders.py) that fills in event_image_folder_url.
         """
-        super().save(*args, **kwargs)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
 
-        # only create a new folder if the folder url field is currently empty and the event is visible
-        if not self.event_image_folder_url and self.visible:
-            # the name of the folder will follow the current convention of:
-            # <Start Date>_<Title>
-            start_date_string = self.start_date.strftime('%Y%m%d')
-            event_folder_name = f'{settings.GOOGLE_DRIVE_STORAGE_MEDIA_ROOT}/{settings.GOOGLE_DRIVE_PHOTODUMP_FOLDER}/{start_date_string}_{self.title.replace(" ", "_")}'
-
-            created_folder = gd_storage._get_or_create_folder(event_folder_name)
-            folder_id = created_folder.get('id', None)
-
-            if folder_id:
-                self.event_image_folder_url = f'https://drive.google.com/drive/folders/{folder_id}'
-
-            super().save(update_fields=["event_image_folder_url"])
+            # only create a new folder if the folder url field is currently empty and the event is visible
+            if not self.event_image_folder_url and self.visible:
+                Job.enqueue_once("provision_event_folders")
 
 
 class Member(models.Model):
@@ -140,6 +281,17 @@ class Member(models.Model):
     is_admin = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            # Handles are looked up case insensitively, so they have to be unique that way too.
+            # Also serves as the index for those lookups.
+            models.UniqueConstraint(
+                Lower('telegram_username'),
+                name='member_telegram_username_lower_unique',
+                violation_error_message="A member with this telegram username already exists (usernames are case insensitive).",
+            ),
+        ]
+
     @property
     def name(self):
         return f"{self.first_name or ''} {self.last_name or ''}".strip()
@@ -148,25 +300,258 @@ class Member(models.Model):
         return self.name
 
 
+class FamilyQuerySet(models.QuerySet):
+    """
+    Queryset helpers for maintaining the denormalised leaderboard
+    """
+    def add_points(self, delta):
+        """
+        Atomically shift the stored points of the selected families by delta
+        """
+        if not delta:
+            return 0
+        return self.update(points=models.F('points') + delta)
+
+    def with_live_points(self):
+        """
+        Annotate each family with its points computed from the submissions table
+        """
+        return self.annotate(
+            live_points=Coalesce(models.Sum('photo_submissions__score'), 0.0) + models.F('points_adjustment')
+        )
+
+    def rebuild_points(self):
+        """
+        Recompute the stored points of the selected families from scratch in a single UPDATE
+        """
+        submission_points = PhotoSubmission.objects.filter(family=models.OuterRef('pk')) \
+            .values('family').annotate(total=models.Sum('score')).values('total')
+        return self.update(points=Coalesce(models.Subquery(submission_points), 0.0) + models.F('points_adjustment'))
+
+
 class Family(models.Model):
     """
     Family model
     """
     fam_name = models.CharField(max_length=30)
     points_adjustment = models.FloatField(default=0)
+    # Denormalised total of submission scores plus points_adjustment.
+    # Maintained incrementally by PhotoSubmission saves/deletes, run `manage.py rebuild_leaderboard` to resync.
+    points = models.FloatField(default=0, editable=False)
 
-    @property
-    def points(self):
+    objects = FamilyQuerySet.as_manager()
+
+    # points_adjustment as last read from the database, used to apply adjustments as a delta
+    _loaded_adjustment = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_adjustment = instance.__dict__.get('points_adjustment')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'points_adjustment' in fields:
+            self._loaded_adjustment = self.__dict__.get('points_adjustment')
+
+    def save(self, *args, **kwargs):
         """
-        Calculate the total points of the family
+        Overridden save method.
+        The points column is never written from the instance once the family exists,
+        since it may have been incremented by submissions after this instance was loaded.
+        Changes to points_adjustment are applied to it as a delta instead, when points_adjustment is saved.
         """
-        result = self.photo_submissions.aggregate(models.Sum('score'))['score__sum']
-        return (result or 0) + self.points_adjustment
+        if self._state.adding or self.pk is None:
+            self.points = self.points_adjustment
+            super().save(*args, **kwargs)
+            self._loaded_adjustment = self.points_adjustment
+            return
+
+        update_fields = kwargs.pop('update_fields', None)
+        if update_fields is None:
+            update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+        saves_adjustment = 'points_adjustment' in update_fields
+        update_fields = [name for name in update_fields if name != 'points']
+
+        with transaction.atomic():
+            super().save(*args, update_fields=update_fields, **kwargs)
+            if saves_adjustment:
+                family = Family.objects.filter(pk=self.pk)
+                if self._loaded_adjustment is None:
+                    family.rebuild_points()
+                else:
+                    family.add_points(self.points_adjustment - self._loaded_adjustment)
+        self.refresh_from_db(fields=['points'])
+
+        if saves_adjustment:
+            self._loaded_adjustment = self.points_adjustment
 
     def __str__(self):
         return self.fam_name
 
 
+SUBMISSION_DESCRIPTIONS = {
+    "random": "On-campus random encounter",
+    "fun": "On-campus fun event",
+    "single": "Off-campus single fam event",
+    "crossover": "Off-campus crossover fam event",
+    "ssa": "SSA-wide event"
+}
+
+SCORING_RULES_CACHE_KEY = "scoring_rules"
+
+
+class ScoringRuleQuerySet(models.QuerySet):
+    def current(self):
+        """
+        The latest version of the rules, as (version, {description: rule}).
+        Cached until a rule is changed (see signals.py), since every new submission needs them.
+        """
+        rules = cache.get(SCORING_RULES_CACHE_KEY)
+        if rules is None:
+            latest = self.order_by('-version').values('version')[:1]
+            found = list(self.filter(version=models.Subquery(latest)))
+            rules = (found[0].version if found else None, {rule.description: rule for rule in found})
+            cache.set(SCORING_RULES_CACHE_KEY, rules, None)
+        return rules
+
+    def score_expression(self, version):
+        """
+        Database expression for the score of submissions under a version of the rules
+        """
+        return models.Case(
+            *(
+                models.When(description=rule.description, then=rule.score_expression())
+                for rule in self.filter(version=version)
+            ),
+            default=models.Value(0.0),
+            output_field=models.FloatField(),
+        )
+
+
+class ScoringRule(models.Model):
+    """
+    How many points a kind of photo submission is worth, in a version of the scoring rules.
+    A submission scores per_person points for every person in it beyond the first people_offset, plus base.
+    Changing the rules is done by adding a new version, then rescoring with `manage.py rescore_submissions`.
+    """
+    version = models.PositiveIntegerField()
+    description = models.CharField(choices=SUBMISSION_DESCRIPTIONS)
+    per_person = models.FloatField(default=0)
+    people_offset = models.IntegerField(default=0, help_text="Number of people not counted, e.g. 1 for the photographer")
+    base = models.FloatField(default=0)
+
+    objects = ScoringRuleQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'description'], name='scoring_rule_version_description_unique'),
+        ]
+
+    def __str__(self):
+        return f"v{self.version} {self.description}"
+
+    def score(self, number_of_people):
+        return self.per_person * (number_of_people - self.people_offset) + self.base
+
+    def score_expression(self):
+        """
+        score() of the number_of_people column
+        """
+        return models.ExpressionWrapper(
+            models.Value(self.per_person) * (models.F('number_of_people') - models.Value(self.people_offset))
+            + models.Value(self.base),
+            output_field=models.FloatField(),
+        )
+
+
+class PhotoSubmissionQuerySet(models.QuerySet):
+    # Upload jobs carry the images, so they are inserted a few megabytes at a time
+    # rather than holding every image of a batch in memory and in one statement
+    upload_job_batch_bytes = 16 * 1024 * 1024
+
+    def bulk_submit(self, submissions):
+        """
+        Insert many new submissions at once. The rows are inserted with one query, their image upload jobs
+        with one query per upload_job_batch_bytes of images, and the leaderboard is updated once per family.
+        family_id has to be filled in already. Being a bulk insert, no signals are sent,
+        so the caller has to bump the cached versions of the families.
+        """
+        for submission in submissions:
+            submission.calculate_score()
+            submission.image_hash = submission.hash_image()
+        earlier = self.find_duplicates(submission.image_hash for submission in submissions)
+        for submission in submissions:
+            submission.duplicate_of = earlier.get(submission.image_hash)
+        uploads = [submission.take_upload() for submission in submissions]
+
+        points = {}
+        with transaction.atomic(savepoint=False):
+            submissions = self.bulk_create(submissions)
+
+            jobs, size = [], 0
+            for submission, upload in zip(submissions, uploads):
+                if upload is None:
+                    continue
+                data = b"".join(upload.chunks())
+                jobs.append(submission.upload_job(data))
+                size += len(data)
+                if size >= self.upload_job_batch_bytes:
+                    Job.objects.bulk_create(jobs)
+                    jobs, size = [], 0
+            Job.objects.bulk_create(jobs)
+
+            # Photos sent twice in the same batch can only be flagged once the first one has an id
+            repeated = []
+            for i, submission in enumerate(submissions):
+                if submission.image_hash is None or submission.duplicate_of is not None:
+                    continue
+                for other in submissions[:i]:
+                    if other.image_hash is not None and phash.distance(submission.image_hash, other.image_hash) <= phash.MAX_DISTANCE:
+                        submission.duplicate_of = other.duplicate_of or other
+                        repeated.append(submission)
+                        break
+            if repeated:
+                self.bulk_update(repeated, ['duplicate_of'])
+
+            for submission in submissions:
+                if submission.family_id is not None:
+                    points[submission.family_id] = points.get(submission.family_id, 0) + (submission.score or 0)
+            for family_id, delta in points.items():
+                Family.objects.filter(pk=family_id).add_points(delta)
+
+        for submission in submissions:
+            submission._take_snapshot()
+        return submissions
+
+    def find_duplicates(self, hashes):
+        """
+        Map of each of the image hashes to the earliest submission of perceptually the same photo, for those that have one.
+        Candidates sharing a chunk with one of the hashes are found through the chunk indexes, then compared in full.
+        """
+        hashes = {image_hash for image_hash in hashes if image_hash is not None}
+        if not hashes:
+            return {}
+
+        candidates = models.Q()
+        for i in range(phash.CHUNKS):
+            candidates |= models.Q(**{f'hash_chunk_{i}__in': {phash.chunks(image_hash)[i] for image_hash in hashes}})
+        candidates = list(
+            self.alias(**{f'hash_chunk_{i}': phash.chunk_expression('image_hash', i) for i in range(phash.CHUNKS)})
+            .filter(candidates)
+            .order_by('id')
+        )
+
+        duplicates = {}
+        for image_hash in hashes:
+            for candidate in candidates:
+                if phash.distance(image_hash, candidate.image_hash) <= phash.MAX_DISTANCE:
+                    duplicates[image_hash] = candidate
+                    break
+        return duplicates
+
+
 class PhotoSubmission(CachedImageModel):
     """
     Model for photo submissions
@@ -175,50 +560,127 @@ class PhotoSubmission(CachedImageModel):
     family = models.ForeignKey(to="Family", on_delete=models.CASCADE, null=True, blank=True, related_name="photo_submissions")
     score = models.FloatField(blank=True, verbose_name="Score (delete to auto-calculate)")
     member = models.ForeignKey(to="Member", on_delete=models.SET_NULL, null=True, related_name="photo_submissions")
-    description = models.TextField(blank=True, choices={
-        "random": "On-campus random encounter",
-        "fun": "On-campus fun event",
-        "single": "Off-campus single fam event",
-        "crossover": "Off-campus crossover fam event",
-        "ssa": "SSA-wide event"
-    })
+    description = models.TextField(blank=True, choices=SUBMISSION_DESCRIPTIONS)
     number_of_people = models.IntegerField(default=0)
     vetted = models.BooleanField(default=False)
+    scoring_version = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        verbose_name="Version of the scoring rules the score was calculated with (empty if entered by hand)",
+    )
+    image_hash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name="Perceptual hash of the image")
+    duplicate_of = models.ForeignKey(
+        to="self", on_delete=models.SET_NULL, null=True, blank=True, related_name="duplicates",
+        verbose_name="Suspected duplicate of (clear if not a duplicate)",
+    )
+
+    objects = PhotoSubmissionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Summing a family's points can be answered from the index alone
+            models.Index(fields=['family', 'score'], name='submission_family_score_idx'),
+            # Admin filter on vetted, listed by upload date
+            models.Index(fields=['vetted', '-date_uploaded'], name='submission_vetted_date_idx'),
+            # Near duplicate search, see phash.py
+            *(
+                models.Index(phash.chunk_expression('image_hash', i), name=f'submission_hash_chunk_{i}_idx')
+                for i in range(phash.CHUNKS)
+            ),
+        ]
+
+    def counted_points(self):
+        """
+        The (family_id, score) this row currently contributes to the leaderboard, as of the last load or save
+        """
+        loaded = self._loaded_values or {}
+        if 'family_id' in loaded and 'score' in loaded:
+            return loaded['family_id'], loaded['score']
+        return None
+
+    def hash_image(self):
+        """
+        Perceptual hash of a newly assigned image. None if the image is not new, or can't be read.
+        """
+        if not self.image or self.image._committed:
+            return None
+        try:
+            return phash.dhash(b"".join(self.image.chunks()))
+        except UnidentifiedImageError:
+            return None
 
     def calculate_score(self):
         """
-        Calculate the score of the photo submission.
-        @property is not used here to avoid unnecessary computation when calculating total points of each fam
+        Calculate the score of the photo submission with the current scoring rules (see ScoringRule).
+        Scores that are already filled in are kept, and ones changed by hand are marked as such
+        by clearing scoring_version, so that rescoring leaves them alone.
         """
-        if self.score is not None: # do not recalculate the score if field is already filled
+        if self.score is not None:
+            loaded = self._loaded_values or {}
+            if 'score' in loaded and self.score != loaded['score']:
+                self.scoring_version = None
             return
-        self.score = 0
-        match self.description:
-            case "ssa":
-                self.score = self.number_of_people * 10
-            case "random":
-                self.score = (self.number_of_people-1) * 2
-            case "fun":
-                self.score = (self.number_of_people-1) * 5
-            case "single":
-                self.score = (self.number_of_people-1) * 5 + 10
-            case "crossover":
-                self.score = (self.number_of_people-1) * 5 + 30
 
+        self.scoring_version, rules = ScoringRule.objects.current()
+        rule = rules.get(self.description)
+        self.score = rule.score(self.number_of_people) if rule else 0
 
     def save(self, *args, **kwargs):
         """
         Overridden save method.
-        Handles the calculation of the score and populating of family field.
+        Handles the calculation of the score, populating of family field and flagging of duplicate photos.
         """
         # Calculate the score
         self.calculate_score()
 
-        # Set the family field
-        self.family = self.member.family
+        # Set the family field. Only the id is needed, so the family itself is not fetched
+        if self.member_id is not None:
+            self.family_id = self.member.family_id
+
+        # Flag a new image if the same photo was submitted before
+        if self.image and not self.image._committed:
+            self.image_hash = self.hash_image()
+            self.duplicate_of = PhotoSubmission.objects.exclude(pk=self.pk) \
+                .find_duplicates([self.image_hash]).get(self.image_hash)
+
+        if kwargs.get('update_fields') is None:
+            # Only the changed columns are written, see CachedImageModel.save
+            writes_points = self.counted_points() != (self.family_id, self.score)
+        else:
+            writes_points = bool({'family', 'score'} & set(kwargs['update_fields']))
+
+        with transaction.atomic(savepoint=False):
+            if self._state.adding or self.pk is None:
+                counted = (None, None)
+            elif not writes_points:
+                # Neither the family nor the score is written, so the leaderboard is unaffected
+                counted = None
+            else:
+                # Read from the locked row, another instance of it may have been saved since this one was loaded
+                counted = PhotoSubmission.objects.select_for_update() \
+                    .values_list('family_id', 'score').get(pk=self.pk)
+
+            # Call the parent save method
+            super().save(*args, **kwargs)
+
+            if counted is not None:
+                self.update_leaderboard(*counted)
+
+    def update_leaderboard(self, old_family_id, old_score):
+        """
+        Move this submission's contribution on the leaderboard from (old_family_id, old_score)
+        to its current family and score.
+        """
+        def add_points(family_id, delta):
+            if family_id is not None:
+                Family.objects.filter(pk=family_id).add_points(delta)
 
-        # Call the parent save method
-        super().save(*args, **kwargs)
+        old_score = old_score or 0
+        new_score = self.score or 0
+        if old_family_id == self.family_id:
+            add_points(self.family_id, new_score - old_score)
+        else:
+            add_points(old_family_id, -old_score)
+            add_points(self.family_id, new_score)
 
 
 class GroupChat(models.Model):
@@ -246,12 +708,52 @@ class ExcoMember(models.Model):
 
     @property
     def photo(self):
-        return img_url_from_id(self.photo_id)
+        return img_url_from_id(self.photo_id, "medium")
     
     @property
     def alt_photo(self):
-        return img_url_from_id(self.alt_photo_id)
+        return img_url_from_id(self.alt_photo_id, "medium")
 
     @property
     def alt(self):
         return f"Photo of {self.name}"
+
+
+class Job(models.Model):
+    """
+    Background job, run by `manage.py run_jobs`. See backend/jobs.py for the handlers.
+    """
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    # Staged bytes for the job, e.g. an image waiting to be uploaded to google drive
+    data = models.BinaryField(blank=True, null=True)
+    status = models.CharField(max_length=10, default="pending", choices={
+        "pending": "Pending",
+        "running": "Running",
+        "done": "Done",
+        "failed": "Failed"
+    })
+    attempts = models.PositiveIntegerField(default=0)
+    # Units of work done out of the total, for jobs that report their progress (e.g. rows of an import)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    # Pending jobs wait until this time (retry backoff), running jobs are reclaimed after it (worker died)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @classmethod
+    def enqueue_once(cls, kind, **kwargs):
+        """
+        Queue a job, unless one of the same kind is already waiting to run.
+        For jobs that process whatever is outstanding when they run, so one queued job covers every caller.
+        """
+        if not cls.objects.filter(kind=kind, status="pending").exists():
+            cls.objects.create(kind=kind, **kwargs)
@@ -0,0 +1,53 @@
+"""
+Perceptual hashes of images, used to spot photos that are submitted more than once.
+The hash (a dHash) records whether each pixel of a tiny greyscale copy of the image is brighter than its neighbour,
+so it survives resizing and re-encoding. Images whose hashes differ in at most MAX_DISTANCE bits are taken to be the same photo.
+
+To find those without comparing against every stored hash, hashes are split into MAX_DISTANCE + 1 chunks that are
+indexed separately. Two hashes that close must have at least one chunk in common, so candidates come out of the indexes.
+"""
+from io import BytesIO
+from django.db.models import F
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8  # the hash has HASH_SIZE * HASH_SIZE bits
+MAX_DISTANCE = 3
+CHUNKS = MAX_DISTANCE + 1
+CHUNK_BITS = HASH_SIZE * HASH_SIZE // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(data):
+    """
+    Perceptual hash of an image, as a signed 64 bit integer to fit a bigint column
+    """
+    with Image.open(BytesIO(data)) as image:
+        # Decode JPEGs at a reduced scale, only a few pixels are needed
+        image.draft("RGB", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image)
+        pixels = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            bits = bits << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+def distance(a, b):
+    """
+    Number of bits two hashes differ in
+    """
+    return ((a ^ b) & (1 << 64) - 1).bit_count()
+
+
+def chunks(value):
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def chunk_expression(field, i):
+    """
+    Database expression for chunk i of the hashes in a field, matching chunks()
+    """
+    return F(field).bitrightshift(i * CHUNK_BITS).bitand(CHUNK_MASK)
@@ -1,5 +1,53 @@
+from django.conf import settings
+from django.utils.encoding import smart_str
+from PIL import UnidentifiedImageError
 from rest_framework import serializers
-from . import models as m
+from rest_framework.relations import MANY_RELATION_KWARGS
+from . import models as m, caching, phash
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Many related field that resolves all of its slugs in a single query,
+    instead of one query per slug like the default ManyRelatedField.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        # Anything else can't be a slug, and can't be looked up or hashed below
+        if not all(isinstance(slug, (str, int, float)) for slug in data):
+            child.fail('invalid')
+        # Numbers are matched as text, like the single lookup does, e.g. 2024 finds the event titled "2024"
+        data = [str(slug) for slug in data]
+        objects = {}
+        for obj in child.get_queryset().filter(**{f'{child.slug_field}__in': data}):
+            slug = str(getattr(obj, child.slug_field))
+            # Same as the single lookup, a slug matching several objects is invalid
+            if slug in objects:
+                child.fail('invalid')
+            objects[slug] = obj
+
+        for slug in data:
+            if slug not in objects:
+                child.fail('does_not_exist', slug_name=child.slug_field, value=smart_str(slug))
+        return [objects[slug] for slug in data]
+
+
+class BulkSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField that resolves in bulk when many=True
+    """
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
 
 
 class EventPublicSerializer(serializers.ModelSerializer):
@@ -9,10 +57,12 @@ class EventPublicSerializer(serializers.ModelSerializer):
     Otherwise api calls will be very very slowwwwwwww
     """
     image = serializers.CharField(source='image_url')
+    image_thumb = serializers.CharField(source='image_thumb_url')
+    image_medium = serializers.CharField(source='image_medium_url')
 
     class Meta:
         model = m.Event
-        fields = ('title', 'start_date', 'end_date', 'venue', 'description', 'image', 'link')
+        fields = ('title', 'start_date', 'end_date', 'venue', 'description', 'image', 'image_thumb', 'image_medium', 'link')
         read_only_fields = fields
 
 
@@ -39,7 +89,7 @@ class MemberSerializer(serializers.ModelSerializer):
     """
     Member serializer
     """
-    events = serializers.SlugRelatedField(
+    events = BulkSlugRelatedField(
         many=True,
         queryset=m.Event.objects.all(),
         slug_field='title'
@@ -54,15 +104,166 @@ class MemberSerializer(serializers.ModelSerializer):
         model = m.Member
         fields = '__all__'
 
+    def validate_telegram_username(self, value):
+        """
+        Usernames are unique ignoring case (see Member.Meta.constraints), which DRF does not check for expression constraints
+        """
+        if value:
+            others = m.Member.objects.filter(telegram_username__lower_exact=value)
+            if self.instance is not None:
+                others = others.exclude(pk=self.instance.pk)
+            if others.exists():
+                raise serializers.ValidationError("A member with this telegram username already exists (usernames are case insensitive).")
+        return value
+
+    def update(self, instance, validated_data):
+        """
+        Overridden update method.
+        Only adds and removes the events that changed, instead of rewriting the whole relation.
+        The current events are usually prefetched by the viewset.
+        """
+        events = validated_data.pop('events', None)
+        instance = super().update(instance, validated_data)
+
+        if events is not None:
+            current = {event.pk for event in instance.events.all()}
+            wanted = {event.pk for event in events}
+            if removed := current - wanted:
+                instance.events.remove(*removed)
+            if added := wanted - current:
+                instance.events.add(*added)
+
+        return instance
+
+
+def duplicate_errors(images):
+    """
+    If duplicate photos are rejected (settings.DUPLICATE_SUBMISSIONS), an error for each image that was submitted before
+    or appears earlier in the list. Returns one error message or None per image.
+    Otherwise duplicates are only flagged when saved, see PhotoSubmission.save.
+    """
+    if settings.DUPLICATE_SUBMISSIONS != "reject":
+        return [None] * len(images)
+
+    hashes = []
+    for image in images:
+        try:
+            hashes.append(phash.dhash(b"".join(image.chunks())))
+        except UnidentifiedImageError:
+            hashes.append(None)
+    earlier = m.PhotoSubmission.objects.find_duplicates(hashes)
+
+    errors = []
+    for i, image_hash in enumerate(hashes):
+        if image_hash in earlier:
+            errors.append(f"This photo was already submitted (submission {earlier[image_hash].pk}).")
+        elif image_hash is not None and any(
+            other is not None and phash.distance(image_hash, other) <= phash.MAX_DISTANCE for other in hashes[:i]
+        ):
+            errors.append("This photo was sent more than once.")
+        else:
+            errors.append(None)
+    return errors
+
+
+class CachedImageField(serializers.ImageField):
+    """
+    Image field that reads the url cached on the model rather than asking google drive storage for it.
+    Uploads happen later in a job, so until then there is no url.
+    """
+    def get_attribute(self, instance):
+        return instance.image_url
+
+    def to_representation(self, value):
+        return value
+
 
 class PhotoSubmissionSerializer(serializers.ModelSerializer):
     """
     Serializer for the photo submission model
     """
+    image = CachedImageField(required=False, allow_null=True)
+
     class Meta:
         model = m.PhotoSubmission
         fields = ('member', 'description', 'number_of_people', 'image', 'score')
 
+    def validate_image(self, image):
+        if image is not None and (error := duplicate_errors([image])[0]):
+            raise serializers.ValidationError(error)
+        return image
+
+
+class PhotoSubmissionItemSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one submission of a batch.
+    Members are only checked for a whole batch at once, see PhotoSubmissionBatchSerializer
+    """
+    member = serializers.IntegerField(source='member_id', required=False, allow_null=True)
+
+    class Meta:
+        model = m.PhotoSubmission
+        fields = ('id', 'member', 'family', 'description', 'number_of_people', 'score')
+        read_only_fields = ('id', 'family')
+
+
+class PhotoSubmissionBatchSerializer(serializers.Serializer):
+    """
+    Serializer for many photo submissions in one multipart request, e.g. a whole album.
+    The images are sent as repeated `images` files, and `items` is a JSON list with the details of each image, in the same order.
+    Every item is validated before anything is created.
+    """
+    MAX_ITEMS = 50
+    MAX_TOTAL_BYTES = 100 * 1024 * 1024
+
+    images = serializers.ListField(child=serializers.ImageField(), allow_empty=False, max_length=MAX_ITEMS)
+    items = serializers.JSONField(binary=True)
+
+    def validate_images(self, images):
+        total = sum(image.size for image in images)
+        if total > self.MAX_TOTAL_BYTES:
+            raise serializers.ValidationError(
+                f'The images add up to {total // (1024 * 1024)} MB, at most {self.MAX_TOTAL_BYTES // (1024 * 1024)} MB can be sent at once.'
+            )
+        return images
+
+    def validate(self, attrs):
+        images, items = attrs['images'], attrs['items']
+        if not isinstance(items, list) or len(items) != len(images):
+            raise serializers.ValidationError({'items': f'Expected a list with the details of each of the {len(images)} images.'})
+
+        item_serializer = PhotoSubmissionItemSerializer(data=items, many=True)
+        if not item_serializer.is_valid():
+            raise serializers.ValidationError({'items': item_serializer.errors})
+        items = item_serializer.validated_data
+
+        # Look up the families of all the members in one query
+        member_ids = {item['member_id'] for item in items if item.get('member_id') is not None}
+        families = dict(m.Member.objects.filter(pk__in=member_ids).values_list('id', 'family_id'))
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        errors = [{} for _ in items]
+        for error, item in zip(errors, items):
+            if item.get('member_id') is not None and item['member_id'] not in families:
+                error['member'] = [does_not_exist.format(pk_value=item['member_id'])]
+        for error, duplicate in zip(errors, duplicate_errors(images)):
+            if duplicate:
+                error['image'] = [duplicate]
+        if any(errors):
+            raise serializers.ValidationError({'items': errors})
+
+        attrs['items'] = items
+        attrs['families'] = families
+        return attrs
+
+    def create(self, validated_data):
+        submissions = [
+            m.PhotoSubmission(**item, family_id=validated_data['families'].get(item.get('member_id')), image=image)
+            for item, image in zip(validated_data['items'], validated_data['images'])
+        ]
+        submissions = m.PhotoSubmission.objects.bulk_submit(submissions)
+        caching.bump_model(m.PhotoSubmission)
+        return submissions
+
 
 class GroupChatSerializer(serializers.ModelSerializer):
     """
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from . import models as m, caching
+
+
+@receiver(post_delete, sender=m.PhotoSubmission)
+def remove_submission_points(sender, instance, **kwargs):
+    """
+    Take a deleted submission's score off its family's points.
+    Done through a signal so that queryset deletes (e.g. the admin delete action) are covered too.
+    """
+    family_id, score = instance.counted_points() or (instance.family_id, instance.score)
+    if family_id is not None:
+        m.Family.objects.filter(pk=family_id).add_points(-(score or 0))
+
+
+@receiver(post_save, sender=m.ScoringRule)
+@receiver(post_delete, sender=m.ScoringRule)
+def clear_scoring_rules(sender, **kwargs):
+    """
+    Drop the cached scoring rules, so that new submissions are scored with the changed rules.
+    Only once the change is committed, otherwise a submission scored in between would cache the old rules again.
+    """
+    transaction.on_commit(lambda: cache.delete(m.SCORING_RULES_CACHE_KEY))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_cache_versions(sender, **kwargs):
+    """
+    Invalidate cached responses of data depending on the saved or deleted model
+    """
+    caching.bump_model(sender)
+
+
+@receiver(m2m_changed)
+def bump_cache_versions_m2m(sender, instance, model, action, **kwargs):
+    """
+    Invalidate cached responses of data depending on either side of a changed many-to-many relation
+    """
+    if action.startswith("post_"):
+        caching.bump_model(type(instance))
+        caching.bump_model(model)
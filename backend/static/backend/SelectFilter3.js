@@ -156,9 +156,11 @@ Requires core.js and SelectBox.js.
             filter_input.addEventListener('keypress', function(e) {
                 SelectFilter.filter_key_press(e, field_id, '_from', '_to');
             });
-            filter_input.addEventListener('keyup', function(e) {
-                SelectFilter.filter_key_up(e, field_id, '_from');
-            });
+            if (!from_box.dataset.searchUrl) {
+                filter_input.addEventListener('keyup', function(e) {
+                    SelectFilter.filter_key_up(e, field_id, '_from');
+                });
+            }
             filter_input.addEventListener('keydown', function(e) {
                 SelectFilter.filter_key_down(e, field_id, '_from', '_to');
             });
@@ -195,9 +197,70 @@ Requires core.js and SelectBox.js.
             // Move selected from_box options to to_box
             SelectBox.move(field_id + '_from', field_id + '_to');
 
+            // Available options are searched on the server rather than filtered here
+            if (from_box.dataset.searchUrl) {
+                SelectFilter.init_search(field_id, from_box.dataset.searchUrl, filter_input);
+            }
+
             // Initial icon refresh
             SelectFilter.refresh_icons(field_id);
         },
+        init_search: function(field_id, search_url, filter_input) {
+            // Fill the available box a page at a time from the search endpoint,
+            // reloading when the filter changes and loading more when scrolled to the bottom
+            const from_box = document.getElementById(field_id + '_from');
+            const state = {term: '', page: 0, more: true, loading: false, timer: null};
+            const load = function(reset) {
+                if (reset) {
+                    state.page = 0;
+                    state.more = true;
+                    SelectBox.cache[field_id + '_from'] = [];
+                    SelectBox.redisplay(field_id + '_from');
+                }
+                if (state.loading || !state.more) {
+                    return;
+                }
+                state.loading = true;
+                const term = state.term;
+                const params = new URLSearchParams({term: term, page: state.page + 1});
+                fetch(search_url + '?' + params, {credentials: 'same-origin'})
+                    .then(response => response.json())
+                    .then(function(data) {
+                        state.loading = false;
+                        if (term !== state.term) {
+                            // The filter changed while loading
+                            load(true);
+                            return;
+                        }
+                        state.page += 1;
+                        state.more = data.more;
+                        const chosen = new Set(SelectBox.cache[field_id + '_to'].map(node => node.value));
+                        for (const result of data.results) {
+                            if (!chosen.has(String(result.id))) {
+                                SelectBox.add_to_cache(field_id + '_from', {value: String(result.id), text: result.text});
+                            }
+                        }
+                        SelectBox.redisplay(field_id + '_from');
+                        SelectFilter.refresh_icons(field_id);
+                    })
+                    .catch(function() {
+                        state.loading = false;
+                    });
+            };
+            filter_input.addEventListener('input', function() {
+                clearTimeout(state.timer);
+                state.timer = setTimeout(function() {
+                    state.term = filter_input.value.trim();
+                    load(true);
+                }, 300);
+            });
+            from_box.addEventListener('scroll', function() {
+                if (from_box.scrollTop + from_box.clientHeight >= from_box.scrollHeight - 20) {
+                    load(false);
+                }
+            });
+            load(true);
+        },
         any_selected: function(field) {
             // Temporarily add the required attribute and check validity.
             field.required = true;
@@ -220,7 +283,9 @@ Requires core.js and SelectBox.js.
             }
         },
         refresh_filtered_selects: function(field_id) {
-            SelectBox.filter(field_id + '_from', document.getElementById(field_id + "_input").value);
+            if (!document.getElementById(field_id + '_from').dataset.searchUrl) {
+                SelectBox.filter(field_id + '_from', document.getElementById(field_id + "_input").value);
+            }
             SelectBox.filter(field_id + '_to', document.getElementById(field_id + "_selected_input").value);
         },
         refresh_icons: function(field_id) {
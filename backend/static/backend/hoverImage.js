@@ -10,9 +10,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // Get all preview links
     const links = document.querySelectorAll('.hover-preview');
     
+    // Images are only loaded once hovered, rather than every preview on the page up front
     links.forEach(link => {
-        preloadImg(link);
-
         link.addEventListener('mouseover', () => {
             currPreview = preloadImg(link);
             currPreview.style.display = 'block';
@@ -28,7 +27,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
 /**
- * Preloads the image at the link provided, creating an element with id matching the link.
+ * Loads the image at the link provided, creating an element with id matching the link.
+ * Subsequent hovers reuse the element.
  * @param {Element} link - the link element related to the image
  * @returns {Element}
  */
@@ -0,0 +1,70 @@
+"""
+Streamed JSON list responses.
+Instead of serializing the whole queryset and rendering one big string, rows are read from the database
+in chunks and written out as elements of a JSON array as they come, so memory use stays flat however long the list is.
+"""
+from django.http import StreamingHttpResponse
+
+
+class StreamingListMixin:
+    """
+    Viewset mixin streaming unpaginated JSON list responses.
+    The body is byte for byte what the JSON renderer would have produced for the whole list.
+    Should come after the caching mixins, so that they wrap the streamed response,
+    and before AsyncReadMixin, whose async lists are streamed the same way.
+    """
+    stream_chunk_size = 200
+
+    def use_streaming_list(self, request):
+        renderer = request.accepted_renderer
+        # An indented document can't be put together from separately rendered elements
+        return renderer.format == "json" and \
+            renderer.get_indent(request.accepted_media_type, self.get_renderer_context()) is None
+
+    def stream_list(self, queryset):
+        renderer = self.request.accepted_renderer
+        serializer = self.get_serializer()
+        chunk, separator = [], b""
+
+        yield b"["
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(renderer.render(serializer.to_representation(instance)))
+            if len(chunk) == self.stream_chunk_size:
+                yield separator + b",".join(chunk)
+                chunk, separator = [], b","
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]"
+
+    async def astream_list(self, queryset):
+        """
+        Same as stream_list, reading the rows through the async ORM (see asyncviews.py)
+        """
+        renderer = self.request.accepted_renderer
+        serializer = self.get_serializer()
+        chunk, separator = [], b""
+
+        yield b"["
+        async for instance in queryset.aiterator(chunk_size=self.stream_chunk_size):
+            chunk.append(renderer.render(serializer.to_representation(instance)))
+            if len(chunk) == self.stream_chunk_size:
+                yield separator + b",".join(chunk)
+                chunk, separator = [], b","
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]"
+
+    def streaming_response(self, request, content):
+        renderer = request.accepted_renderer
+        content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_streaming_list(request):
+            return super().list(request, *args, **kwargs)
+        return self.streaming_response(request, self.stream_list(self.filter_queryset(self.get_queryset())))
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.use_streaming_list(request):
+            return await super().alist(request, *args, **kwargs)
+        return self.streaming_response(request, self.astream_list(self.filter_queryset(self.get_queryset())))
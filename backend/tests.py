@@ -1,3 +1,1327 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from googleapiclient.errors import HttpError
+import httplib2
+import openpyxl
+import tablib
+from import_export.formats import base_formats
+from PIL import Image
+from . import models as m, jobs, images, folders, phash, drive, serializers, views as v
+from .admin import forms as f, resources as r
 
-# Create your tests here.
+
+def body(response):
+    """
+    Content of a response, streamed or not
+    """
+    if not response.streaming:
+        return response.content
+    if response.is_async:
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(read)()
+    return b"".join(response.streaming_content)
+
+
+# The cache is a database table by default, so that the web service and the job worker share it.
+# Tests counting the queries of the views keep it in memory, to count only the views' own database work.
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class LeaderboardTests(TestCase):
+    """
+    The stored family points should always agree with the live aggregate
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.red = m.Family.objects.create(fam_name="Red")
+        cls.blue = m.Family.objects.create(fam_name="Blue")
+        cls.alice = m.Member.objects.create(first_name="Alice", family=cls.red)
+        cls.bob = m.Member.objects.create(first_name="Bob", family=cls.blue)
+
+    def assertPoints(self, family, points):
+        family.refresh_from_db()
+        self.assertEqual(family.points, points)
+        live = m.Family.objects.with_live_points().get(pk=family.pk).live_points
+        self.assertEqual(live, points)
+
+    def test_create_rescore_and_delete(self):
+        submission = m.PhotoSubmission.objects.create(member=self.alice, description="fun", number_of_people=3)
+        self.assertPoints(self.red, 10)
+
+        submission.score = 4
+        submission.save()
+        self.assertPoints(self.red, 4)
+
+        m.PhotoSubmission.objects.filter(pk=submission.pk).delete()
+        self.assertPoints(self.red, 0)
+
+    def test_save_after_refresh(self):
+        submission = m.PhotoSubmission.objects.create(member=self.alice, score=1)
+        submission = m.PhotoSubmission.objects.get(pk=submission.pk)
+        other = m.PhotoSubmission.objects.get(pk=submission.pk)
+        other.score = 3
+        other.save()
+
+        submission.refresh_from_db()
+        submission.score = 5
+        submission.save()
+        self.assertPoints(self.red, 5)
+
+    def test_stale_instances(self):
+        submission = m.PhotoSubmission.objects.create(member=self.alice, score=1)
+        first = m.PhotoSubmission.objects.get(pk=submission.pk)
+        second = m.PhotoSubmission.objects.get(pk=submission.pk)
+        first.score = 5
+        first.save()
+        second.score = 3
+        second.save()
+        self.assertPoints(self.red, 3)
+
+    def test_move_between_families(self):
+        submission = m.PhotoSubmission.objects.create(member=self.alice, score=7)
+        submission = m.PhotoSubmission.objects.get(pk=submission.pk)
+        submission.member = self.bob
+        submission.save()
+        self.assertPoints(self.red, 0)
+        self.assertPoints(self.blue, 7)
+
+    def test_adjustment_does_not_clobber_submissions(self):
+        stale = m.Family.objects.get(pk=self.red.pk)
+        m.PhotoSubmission.objects.create(member=self.alice, score=5)
+        stale.points_adjustment = 2
+        stale.save()
+        self.assertEqual(stale.points, 7)
+        self.assertPoints(self.red, 7)
+
+    def test_adjustment_after_refresh(self):
+        family = m.Family.objects.get(pk=self.red.pk)
+        other = m.Family.objects.get(pk=self.red.pk)
+        other.points_adjustment = 5
+        other.save()
+        family.refresh_from_db()
+        family.points_adjustment = 7
+        family.save()
+        self.assertPoints(self.red, 7)
+
+    def test_adjustment_not_saved(self):
+        family = m.Family.objects.get(pk=self.red.pk)
+        family.points_adjustment = 100
+        family.fam_name = "Crimson"
+        family.save(update_fields=["fam_name"])
+        self.assertPoints(self.red, 0)
+        family.save()
+        self.assertPoints(self.red, 100)
+
+    def test_rebuild_command(self):
+        m.PhotoSubmission.objects.create(member=self.alice, score=3)
+        m.Family.objects.update(points=100)
+        call_command("rebuild_leaderboard", stdout=StringIO())
+        self.assertPoints(self.red, 3)
+        self.assertPoints(self.blue, 0)
+
+
+class UploadQueueTests(TestCase):
+    """
+    Images are staged in upload jobs on save and uploaded to google drive by the worker
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = m.Member.objects.create(first_name="Alice", family=m.Family.objects.create(fam_name="Red"))
+
+    def create_submission(self):
+        return m.PhotoSubmission.objects.create(
+            member=self.member, score=1, image=SimpleUploadedFile("photo.jpg", make_jpeg((40, 30)))
+        )
+
+    @mock.patch.object(m.gd_storage, "save")
+    def test_save_stages_upload(self, save):
+        submission = self.create_submission()
+        save.assert_not_called()
+        self.assertIsNone(submission.image_id)
+        self.assertEqual(submission.image.name, "photosubmission_images/photo.jpg")
+
+        job = m.Job.objects.get()
+        self.assertEqual(job.kind, "upload_image")
+        self.assertEqual(bytes(job.data), make_jpeg((40, 30)))
+
+    @mock.patch.object(m.gd_storage, "url", return_value="https://drive.google.com/uc?id=abc123&export=download")
+    @mock.patch.object(m.gd_storage, "save", return_value="photo.jpg")
+    def test_worker_uploads_and_sets_image_id(self, save, url):
+        submission = self.create_submission()
+        self.assertEqual(jobs.run_pending(), 1)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.image_id, "abc123")
+        self.assertEqual(submission.image.name, "photo.jpg")
+        job = m.Job.objects.get()
+        self.assertEqual(job.status, "done")
+        self.assertIsNone(job.data)
+
+    @mock.patch.object(m.gd_storage, "save", side_effect=OSError("drive is down"))
+    def test_failed_upload_is_retried_later(self, save):
+        self.create_submission()
+        with self.assertLogs("backend.jobs", "ERROR"):
+            self.assertEqual(jobs.run_pending(), 1)
+
+        job = m.Job.objects.get()
+        self.assertEqual(job.status, "pending")
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("drive is down", job.last_error)
+        # Backing off, so nothing is due yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SaveQueryCountTests(TestCase):
+    """
+    Each save path should write the row once, with only its changed columns
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.red = m.Family.objects.create(fam_name="Red")
+        cls.alice = m.Member.objects.create(first_name="Alice", family=cls.red)
+
+    def setUp(self):
+        # The scoring rules are cached after their first use
+        m.ScoringRule.objects.current()
+
+    def test_submission_create_with_image(self):
+        member = m.Member.objects.get(pk=self.alice.pk)
+        image = SimpleUploadedFile("a.jpg", make_jpeg((40, 30)))
+        # SELECT earlier submissions of the photo, INSERT submission, INSERT upload job, UPDATE family points
+        with self.assertNumQueries(4):
+            m.PhotoSubmission.objects.create(member=member, description="fun", number_of_people=2, image=image)
+
+    def test_submission_rescore(self):
+        submission_id = m.PhotoSubmission.objects.create(member=self.alice, score=1).pk
+        submission = m.PhotoSubmission.objects.select_related("member").get(pk=submission_id)
+        submission.score = 5
+        # SELECT the old score FOR UPDATE, UPDATE submission (score only), UPDATE family points
+        with self.assertNumQueries(3) as ctx:
+            submission.save()
+        self.assertNotIn('"description"', ctx.captured_queries[1]["sql"])
+
+    def test_unchanged_save_is_a_no_op(self):
+        submission_id = m.PhotoSubmission.objects.create(member=self.alice, score=1).pk
+        submission = m.PhotoSubmission.objects.select_related("member").get(pk=submission_id)
+        with self.assertNumQueries(0):
+            submission.save()
+
+    def test_submission_image_replaced(self):
+        submission_id = m.PhotoSubmission.objects.create(member=self.alice, score=1).pk
+        submission = m.PhotoSubmission.objects.select_related("member").get(pk=submission_id)
+        submission.image = SimpleUploadedFile("b.jpg", b"b")
+        # UPDATE submission (image and image_id), INSERT upload job
+        with self.assertNumQueries(2):
+            submission.save()
+
+    def test_visible_event_create(self):
+        # INSERT event, check for a queued folder job, INSERT folder job
+        with self.assertNumQueries(3):
+            m.Event.objects.create(
+                title="Welcome Tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman", visible=True
+            )
+
+    def test_event_clone(self):
+        event = m.Event.objects.create(
+            title="Welcome Tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman"
+        )
+        event = m.Event.objects.get(pk=event.pk)
+        original = event.pk
+        event.pk = None
+        event.save()
+        self.assertNotIn(event.pk, (None, original))
+        self.assertEqual(m.Event.objects.filter(title="Welcome Tea").count(), 2)
+
+        # Forced inserts are not turned into updates of the changed columns either
+        event.pk = original + 1000
+        event.save(force_insert=True)
+        self.assertEqual(m.Event.objects.filter(title="Welcome Tea").count(), 3)
+
+    def test_event_update(self):
+        event_id = m.Event.objects.create(
+            title="Welcome Tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman"
+        ).pk
+        event = m.Event.objects.get(pk=event_id)
+        event.venue = "Royce"
+        with self.assertNumQueries(1):
+            event.save()
+        self.assertEqual(m.Event.objects.get(pk=event_id).venue, "Royce")
+
+
+def make_jpeg(size=(2000, 1000)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class ImageProxyTests(TransactionTestCase):
+    """
+    Resized variants are rendered once per download and served with strong etags.
+    A TransactionTestCase, since under ASGI the variants are rendered on the drive pool, whose threads have their own connections.
+    """
+    def setUp(self):
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        self.enterContext(override_settings(IMAGE_CACHE_ROOT=cache_root.name))
+        m.ExcoMember.objects.create(id=1, name="Alice", role="President", year="4", major="CS", photo_id="abc123")
+
+    @mock.patch.object(images, "download_original", return_value=make_jpeg())
+    def test_variant_is_resized_and_cached(self, download_original):
+        response = self.client.get("/images/abc123/thumb/", HTTP_ACCEPT="image/webp")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (320, 160))
+
+        # The other variants were rendered from the same download
+        response = self.client.get("/images/abc123/medium/", HTTP_ACCEPT="image/webp")
+        self.assertEqual(response.status_code, 200)
+        download_original.assert_called_once()
+
+        response = self.client.get("/images/abc123/medium/", HTTP_ACCEPT="image/webp", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_image_is_not_proxied(self):
+        self.assertEqual(self.client.get("/images/someoneelses/thumb/").status_code, 404)
+        self.assertEqual(self.client.get("/images/abc123/huge/").status_code, 404)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = images.ImageCache(images.get_cache().root, max_bytes=350)
+        for key in ("a", "b", "c"):
+            cache.put(key, b"x" * 100)
+            os.utime(cache.path(key), (0, {"a": 1, "b": 2, "c": 3}[key]))
+        cache.get("a")
+        cache.put("d", b"x" * 100)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("d"))
+
+    def test_cache_scans_only_when_estimated_full(self):
+        cache = images.ImageCache(images.get_cache().root, max_bytes=1000)
+        with mock.patch.object(images.os, "scandir", wraps=os.scandir) as scandir:
+            for key in "abcde":
+                cache.put(key, b"x" * 100)
+            # Once to learn the size of the directory
+            self.assertEqual(scandir.call_count, 1)
+            for key in "fghijk":
+                cache.put(key, b"x" * 100)
+            self.assertEqual(scandir.call_count, 2)
+        self.assertEqual(cache.size, 900)
+
+
+@mock.patch.object(folders, "get_parent_folder_id", return_value="parent")
+class EventFolderTests(TestCase):
+    """
+    Event folders are created in the background, in batches, reusing existing ones
+    """
+    def create_event(self, title, visible=True, start_date=datetime(2024, 9, 1, 19, tzinfo=timezone.utc)):
+        return m.Event.objects.create(title=title, start_date=start_date, venue="Ackerman", visible=visible)
+
+    @mock.patch.object(folders, "create_folders", return_value=({"20240901_Beach_Day": "new"}, []))
+    @mock.patch.object(folders, "list_child_folders", return_value={"20240901_Welcome_Tea": "old"})
+    def test_provision(self, list_child_folders, create_folders, get_parent_folder_id):
+        welcome = self.create_event("Welcome Tea")
+        beach = self.create_event("Beach Day")
+        hidden = self.create_event("Exco Meeting", visible=False)
+        # One job covers every event saved before it runs
+        self.assertEqual(m.Job.objects.filter(kind="provision_event_folders").count(), 1)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        create_folders.assert_called_once_with("parent", ["20240901_Beach_Day"])
+        welcome.refresh_from_db()
+        beach.refresh_from_db()
+        hidden.refresh_from_db()
+        self.assertEqual(welcome.event_image_folder_url, folders.folder_url("old"))
+        self.assertEqual(beach.event_image_folder_url, folders.folder_url("new"))
+        self.assertIsNone(hidden.event_image_folder_url)
+
+        # Nothing left to do on a re-run
+        self.assertEqual(folders.provision_event_folders(), 0)
+
+    @mock.patch.object(folders, "list_child_folders", return_value={})
+    def test_parent_folder_removed(self, list_child_folders, get_parent_folder_id):
+        # The cached parent is only found to be gone when the folders are created in it
+        not_found = HttpError(httplib2.Response({"status": 404}), b"")
+        beach = self.create_event("Beach Day")
+        with mock.patch.object(folders, "create_folders", side_effect=[({}, [not_found]), ({"20240901_Beach_Day": "new"}, [])]):
+            self.assertEqual(folders.provision_event_folders(), 1)
+        get_parent_folder_id.assert_called_with(refresh=True)
+        beach.refresh_from_db()
+        self.assertEqual(beach.event_image_folder_url, folders.folder_url("new"))
+
+    def test_thread_storage(self, get_parent_folder_id):
+        storage = mock.Mock()
+        storage._drive_service.files.return_value.list.return_value.execute.return_value = {"files": [{"id": "1", "name": "a"}]}
+        with mock.patch.object(drive, "storage", return_value=storage):
+            self.assertEqual(folders.list_child_folders("parent"), {"a": "1"})
+
+    def test_folder_name_uses_local_date(self, get_parent_folder_id):
+        # 20:00 in Los Angeles, already the next day in UTC
+        event = self.create_event("Night Market", start_date=datetime(2024, 9, 2, 3, tzinfo=timezone.utc))
+        event = m.Event.objects.get(pk=event.pk)
+        self.assertEqual(folders.folder_name(event), "20240901_Night_Market")
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ConditionalGetTests(TestCase):
+    """
+    Public read endpoints answer with 304 until the underlying data changes
+    """
+    def setUp(self):
+        cache.clear()
+        self.event = m.Event.objects.create(
+            title="Welcome Tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman"
+        )
+        m.Event.objects.filter(pk=self.event.pk).update(visible=True)
+
+    def test_events_not_modified_until_saved(self):
+        response = self.client.get("/events/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Authorization", response["Vary"])
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/events/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.event.venue = "Royce"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.save()
+            # Not bumped until the save is committed
+            self.assertEqual(self.client.get("/events/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get("/events/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_api_key_requests_are_not_conditional(self):
+        with mock.patch.dict(os.environ, {"API_KEY": "key"}):
+            response = self.client.get("/events/", HTTP_AUTHORIZATION="api-key key")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+    def test_exco(self):
+        etag = self.client.get("/exco/")["ETag"]
+        self.assertEqual(self.client.get("/exco/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            m.ExcoMember.objects.create(id=1, name="Alice", role="President", year="4", major="CS")
+        self.assertEqual(self.client.get("/exco/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class ResponseCacheTests(TestCase):
+    """
+    Rendered responses are reused until a model they depend on changes
+    """
+    def setUp(self):
+        cache.clear()
+        self.red = m.Family.objects.create(fam_name="Red")
+        self.alice = m.Member.objects.create(first_name="Alice", family=self.red)
+
+    def get_families(self):
+        response = self.client.get("/families/", HTTP_AUTHORIZATION="api-key key")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_families_invalidated_by_submissions(self):
+        self.assertEqual(self.get_families(), [{"id": self.red.id, "fam_name": "Red", "points": 0.0}])
+        with self.assertNumQueries(0):
+            self.get_families()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            m.PhotoSubmission.objects.create(member=self.alice, score=4)
+        self.assertEqual(self.get_families()[0]["points"], 4.0)
+
+    def test_auth_mode_is_part_of_the_key(self):
+        m.Event.objects.create(
+            title="Welcome Tea", start_date=datetime.now(timezone.utc), venue="Ackerman", event_image_folder_url="https://drive.google.com/x"
+        )
+        m.Event.objects.update(visible=True)
+        public = json.loads(body(self.client.get("/events/")))
+        api = self.client.get("/events/", HTTP_AUTHORIZATION="api-key key").json()
+        self.assertNotIn("event_image_folder_url", public[0])
+        self.assertIn("event_image_folder_url", api["results"][0])
+        self.assertEqual(self.client.get("/events/", HTTP_AUTHORIZATION="api-key wrong").status_code, 403)
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class UncommittedWriteCacheTests(TransactionTestCase):
+    """
+    A read running while a write is still uncommitted does not cache the old data as the new version
+    """
+    def read_families(self):
+        """
+        Read the leaderboard on another thread, with its own connection
+        """
+        results = []
+        def read():
+            try:
+                results.append(self.client.get("/families/", HTTP_AUTHORIZATION="api-key key").json())
+            finally:
+                connection.close()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def test_read_during_write(self):
+        cache.clear()
+        alice = m.Member.objects.create(first_name="Alice", family=m.Family.objects.create(fam_name="Red"))
+        self.assertEqual(self.read_families()[0]["points"], 0.0)
+
+        with transaction.atomic():
+            m.PhotoSubmission.objects.create(member=alice, score=4)
+            self.assertEqual(self.read_families()[0]["points"], 0.0)
+        self.assertEqual(self.read_families()[0]["points"], 4.0)
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class MemberUpdateTests(TestCase):
+    """
+    Updating a member's events takes the same number of queries however many events are listed
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.red = m.Family.objects.create(fam_name="Red")
+        cls.alice = m.Member.objects.create(first_name="Alice", telegram_username="Alice", family=cls.red)
+        cls.events = [
+            m.Event.objects.create(title=f"Event {i}", start_date=datetime(2024, 9, i + 1, tzinfo=timezone.utc), venue="Ackerman")
+            for i in range(6)
+        ]
+
+    def patch_events(self, titles):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                "/members/u/alice/", {"events": titles}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(response.json()["events"]), sorted(titles))
+        return len(ctx.captured_queries)
+
+    def test_constant_queries(self):
+        self.alice.events.set(self.events[:1])
+        few = self.patch_events(["Event 1", "Event 2"])
+        self.alice.events.set(self.events[:1])
+        many = self.patch_events([f"Event {i}" for i in range(1, 6)])
+        self.assertEqual(few, many)
+
+    def test_unknown_title(self):
+        response = self.client.patch(
+            "/members/u/alice/", {"events": ["Event 1", "Nope"]}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Nope", str(response.json()["events"]))
+
+    def test_non_scalar_titles(self):
+        for events in ([{"a": 1}], [["Event 1"]]):
+            response = self.client.patch(
+                "/members/u/alice/", {"events": events}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("events", response.json())
+
+    def test_numeric_titles(self):
+        event = m.Event.objects.create(title="2024", start_date=datetime(2024, 9, 20, tzinfo=timezone.utc), venue="Ackerman")
+        response = self.client.patch(
+            "/members/u/alice/", {"events": [2024]}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(list(self.alice.events.all()), [event])
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class TelegramUsernameLookupTests(TestCase):
+    """
+    Telegram usernames are matched case insensitively, through the functional index on Lower(telegram_username)
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = m.Member.objects.create(first_name="Alice", telegram_username="Alice")
+
+    def test_lookup_is_case_insensitive(self):
+        response = self.client.get("/members/u/aLiCe/", HTTP_AUTHORIZATION="api-key key")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["telegram_username"], "Alice")
+
+    def test_lookup_uses_index(self):
+        with connection.cursor() as cursor:
+            # The table is tiny, so make sure the planner only falls back to a seq scan if the index is unusable
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = m.Member.objects.filter(telegram_username__lower_exact="ALICE").explain()
+        self.assertIn("member_telegram_username_lower_unique", plan)
+
+    def test_usernames_unique_ignoring_case(self):
+        with self.assertRaises(ValidationError):
+            m.Member(first_name="Alice", telegram_username="alice").validate_constraints()
+
+    def test_migration_lists_conflicting_members(self):
+        migration = importlib.import_module("backend.migrations.0017_member_telegram_username_lower_unique")
+        migration.check_duplicates(django_apps, None)
+        # Rows from before the constraint, rolled back with the test
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(m.Member, m.Member._meta.constraints[0])
+        bob = m.Member.objects.create(first_name="Bob", telegram_username="ALICE")
+        with self.assertRaisesMessage(RuntimeError, f"alice: members {self.alice.id}, {bob.id}"):
+            migration.check_duplicates(django_apps, None)
+
+    def test_api_rejects_usernames_differing_in_case(self):
+        m.Member.objects.create(first_name="Bob", telegram_username="bob")
+        response = self.client.patch(
+            "/members/u/bob/", {"telegram_username": "ALICE"}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("telegram_username", response.json())
+        response = self.client.patch(
+            "/members/u/alice/", {"telegram_username": "ALICE"}, content_type="application/json", HTTP_AUTHORIZATION="api-key key"
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class EventPaginationTests(TestCase):
+    """
+    The telebot pages through events with cursors, which need no count and don't shift when events are added
+    """
+    def setUp(self):
+        cache.clear()
+        now = datetime.now(timezone.utc)
+        m.Event.objects.bulk_create(
+            # Pairs of events on the same day, to check ties are broken by id
+            m.Event(title=f"Event {i}", start_date=now - timedelta(days=i // 2 + 1), venue="Ackerman", visible=True)
+            for i in range(25)
+        )
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_AUTHORIZATION="api-key key")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pages(self):
+        with CaptureQueriesContext(connection) as ctx:
+            page = self.get("/events/?page_size=10")
+        self.assertNotIn("COUNT(", " ".join(q["sql"] for q in ctx.captured_queries))
+        self.assertNotIn("count", page)
+
+        titles = [event["title"] for event in page["results"]]
+        # An event added while paging does not shift the following pages
+        m.Event.objects.create(title="New", start_date=datetime.now(timezone.utc), venue="Ackerman", visible=True)
+        while page["next"]:
+            page = self.get(page["next"])
+            titles += [event["title"] for event in page["results"]]
+        expected = m.Event.objects.exclude(title="New").order_by("-start_date", "-id").values_list("title", flat=True)
+        self.assertEqual(titles, list(expected))
+
+    def test_page_numbers(self):
+        page = self.get("/events/?page=2")
+        self.assertEqual(page["count"], 25)
+        self.assertEqual(len(page["results"]), 5)
+        self.assertEqual(self.get("/events/?pagination=page")["count"], 25)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class StreamingListTests(TestCase):
+    """
+    The public event list is streamed, with the same body the renderer would produce, and still cached
+    """
+    def setUp(self):
+        cache.clear()
+        m.Event.objects.bulk_create(
+            m.Event(title=f"Event {i}", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman – “Royce”", visible=True)
+            for i in range(5)
+        )
+
+    @mock.patch("backend.views.EventViewSet.stream_chunk_size", 2)
+    def test_matches_rendered_response(self):
+        response = self.client.get("/events/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        streamed = body(response)
+
+        cache.clear()
+        with mock.patch("backend.views.EventViewSet.use_streaming_list", return_value=False):
+            rendered = self.client.get("/events/")
+        self.assertFalse(rendered.streaming)
+        self.assertEqual(streamed, rendered.content)
+
+    def test_empty(self):
+        m.Event.objects.all().delete()
+        self.assertEqual(body(self.client.get("/events/")), b"[]")
+
+    def test_cached_once_sent(self):
+        streamed = body(self.client.get("/events/"))
+        with self.assertNumQueries(0):
+            self.assertEqual(body(self.client.get("/events/")), streamed)
+
+    @mock.patch("backend.views.EventViewSet.response_cache_max_bytes", 100)
+    def test_large_bodies_not_cached(self):
+        body(self.client.get("/events/"))
+        with CaptureQueriesContext(connection) as ctx:
+            body(self.client.get("/events/"))
+        self.assertTrue(ctx.captured_queries)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class BatchSubmissionTests(TestCase):
+    """
+    An album is submitted in one request, taking the same number of queries however many photos it has
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.red = m.Family.objects.create(fam_name="Red")
+        cls.blue = m.Family.objects.create(fam_name="Blue")
+        cls.alice = m.Member.objects.create(first_name="Alice", family=cls.red)
+        cls.bob = m.Member.objects.create(first_name="Bob", family=cls.blue)
+
+    def submit(self, items):
+        images = [SimpleUploadedFile(f"photo{i}.jpg", make_jpeg((40, 30)), "image/jpeg") for i in range(len(items))]
+        return self.client.post(
+            "/submissions/batch/", {"images": images, "items": json.dumps(items)}, HTTP_AUTHORIZATION="api-key key"
+        )
+
+    def test_album(self):
+        items = [
+            {"member": self.alice.id, "description": "random", "number_of_people": 3},
+            {"member": self.bob.id, "description": "single", "number_of_people": 2},
+            {"member": self.alice.id, "description": "random", "number_of_people": 2, "score": 7},
+        ]
+        response = self.submit(items)
+        self.assertEqual(response.status_code, 201, response.content)
+        results = response.json()
+        self.assertEqual([r["score"] for r in results], [4, 15, 7])
+        self.assertEqual([r["family"] for r in results], [self.red.id, self.blue.id, self.red.id])
+
+        self.assertEqual(m.Job.objects.filter(kind="upload_image").count(), 3)
+        self.assertEqual(dict(m.Family.objects.values_list("fam_name", "points")), {"Red": 11, "Blue": 15})
+        call_command("rebuild_leaderboard", check=True, stdout=StringIO())
+
+    def test_constant_queries(self):
+        item = {"member": self.alice.id, "description": "random", "number_of_people": 3}
+        m.ScoringRule.objects.current()
+        with CaptureQueriesContext(connection) as one:
+            self.submit([item])
+        with CaptureQueriesContext(connection) as many:
+            self.submit([item] * 5)
+        self.assertEqual(len(one), len(many))
+
+    def test_large_images_split_job_inserts(self):
+        item = {"member": self.alice.id, "description": "random", "number_of_people": 3}
+        with mock.patch.object(m.PhotoSubmissionQuerySet, "upload_job_batch_bytes", 1), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.submit([item] * 3)
+        self.assertEqual(response.status_code, 201, response.content)
+        job_inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "backend_job"')]
+        self.assertEqual(len(job_inserts), 3)
+        self.assertEqual(m.Job.objects.filter(kind="upload_image").count(), 3)
+
+    def test_total_size_limit(self):
+        item = {"member": self.alice.id, "description": "random", "number_of_people": 3}
+        with mock.patch.object(serializers.PhotoSubmissionBatchSerializer, "MAX_TOTAL_BYTES", len(make_jpeg((40, 30))) * 2):
+            response = self.submit([item] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("images", response.json())
+        self.assertFalse(m.PhotoSubmission.objects.exists())
+
+    def test_invalid_items_create_nothing(self):
+        response = self.submit([
+            {"member": self.alice.id, "description": "random", "number_of_people": 3},
+            {"member": self.alice.id, "description": "nope"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["items"][0], {})
+        self.assertIn("description", response.json()["items"][1])
+
+        response = self.submit([
+            {"member": self.alice.id, "description": "random", "number_of_people": 3},
+            {"member": 0, "description": "random"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("member", response.json()["items"][1])
+        self.assertFalse(m.PhotoSubmission.objects.exists())
+
+        response = self.submit([])
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentJobTests(TransactionTestCase):
+    """
+    Workers can run the jobs they claim on a thread pool, each thread with its own connection and drive client
+    """
+    def test_uploads(self):
+        member = m.Member.objects.create(first_name="Alice")
+        submissions = m.PhotoSubmission.objects.bulk_submit([
+            m.PhotoSubmission(member=member, score=1, image=SimpleUploadedFile(f"photo{i}.jpg", make_jpeg((40, 30))))
+            for i in range(6)
+        ])
+        storage = mock.Mock()
+        storage.save.side_effect = lambda name, content: name
+        storage.url.side_effect = lambda name: f"https://drive.google.com/uc?id={name.split('/')[-1][:-4]}&export=download"
+
+        pool = jobs.worker_pool(3)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(drive, "GoogleDriveStorage", return_value=storage) as storage_class:
+            # Batches claimed one after another reuse the threads, and their drive clients
+            self.assertEqual(jobs.run_pending(limit=3, pool=pool), 3)
+            self.assertEqual(jobs.run_pending(limit=3, pool=pool), 3)
+        self.assertLessEqual(storage_class.call_count, 3)
+
+        self.assertEqual(m.Job.objects.filter(status="done").count(), 6)
+        self.assertEqual(
+            sorted(m.PhotoSubmission.objects.values_list("image_id", flat=True)),
+            sorted(f"photo{i}" for i in range(6)),
+        )
+
+
+@mock.patch.object(m.gd_storage, "url", return_value="https://drive.google.com/uc?id=abc123&export=download")
+@mock.patch.object(m.gd_storage, "save", side_effect=lambda name, content: name)
+class ImageNormalizationTests(TestCase):
+    """
+    Uploads are oriented, stripped of metadata, downscaled and re-encoded before going to google drive
+    """
+    def uploaded(self, save):
+        self.assertEqual(jobs.run_pending(), 1)
+        name, content = save.call_args.args
+        return name, Image.open(BytesIO(content.read()))
+
+    def test_submission(self, save, url):
+        # A portrait photo stored sideways, as phones do, with its orientation and location in the EXIF
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+        exif[0x8825] = {1: "N"}  # GPS info
+        Image.new("RGB", (3000, 2000), "red").save(buffer, format="JPEG", exif=exif, quality=95)
+
+        submission = m.PhotoSubmission.objects.create(score=1, image=SimpleUploadedFile("photo.jpeg", buffer.getvalue()))
+        name, image = self.uploaded(save)
+        self.assertEqual(name, "photosubmission_images/photo.jpg")
+        self.assertEqual(image.size, (1365, 2048))
+        self.assertFalse(image.getexif())
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.image_original_size, len(buffer.getvalue()))
+        self.assertLess(submission.image_size, submission.image_original_size)
+
+    def test_event_banner_keeps_resolution(self, save, url):
+        buffer = BytesIO()
+        Image.new("RGBA", (3000, 1000), (255, 0, 0, 128)).save(buffer, format="PNG")
+        m.Event.objects.create(
+            title="Welcome Tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman",
+            image=SimpleUploadedFile("banner.png", buffer.getvalue()),
+        )
+        name, image = self.uploaded(save)
+        self.assertEqual((name, image.format, image.size), ("event_images/banner.png", "PNG", (3000, 1000)))
+
+
+def make_photo(seed, size=(400, 300)):
+    """
+    JPEG of a random pattern, so that different seeds give perceptually different photos
+    """
+    rng = random.Random(seed)
+    pattern = Image.frombytes("L", (8, 6), bytes(rng.randrange(256) for _ in range(48)))
+    buffer = BytesIO()
+    pattern.resize(size, Image.BILINEAR).convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+@mock.patch.object(m.gd_storage, "url", mock.Mock(return_value=None))
+class DuplicateSubmissionTests(TestCase):
+    """
+    Resubmitted photos are flagged (or rejected) before they are uploaded, even if resized or re-encoded
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = m.Member.objects.create(first_name="Alice")
+
+    def submit(self, data, **extra):
+        return self.client.post(
+            "/submissions/",
+            {"member": self.alice.id, "description": "random", "image": SimpleUploadedFile("photo.jpg", data, "image/jpeg")},
+            HTTP_AUTHORIZATION="api-key key",
+            **extra,
+        )
+
+    def test_hash_survives_resizing(self):
+        self.assertLessEqual(phash.distance(phash.dhash(make_photo(1)), phash.dhash(make_photo(1, (1000, 750)))), phash.MAX_DISTANCE)
+        self.assertGreater(phash.distance(phash.dhash(make_photo(1)), phash.dhash(make_photo(2))), phash.MAX_DISTANCE)
+
+    def test_flagged(self):
+        self.assertEqual(self.submit(make_photo(1)).status_code, 201)
+        self.assertEqual(self.submit(make_photo(2)).status_code, 201)
+        self.assertEqual(self.submit(make_photo(1, (800, 600))).status_code, 201)
+
+        first, other, resubmitted = m.PhotoSubmission.objects.order_by("id")
+        self.assertIsNone(first.duplicate_of)
+        self.assertIsNone(other.duplicate_of)
+        self.assertEqual(resubmitted.duplicate_of, first)
+
+    def test_batch(self):
+        original = m.PhotoSubmission.objects.create(score=0, image=SimpleUploadedFile("photo.jpg", make_photo(1)))
+        with CaptureQueriesContext(connection) as ctx:
+            submissions = m.PhotoSubmission.objects.bulk_submit([
+                m.PhotoSubmission(score=0, image=SimpleUploadedFile("photo.jpg", data))
+                for data in (make_photo(1), make_photo(2), make_photo(2))
+            ])
+        self.assertEqual([s.duplicate_of for s in submissions], [original, None, submissions[1]])
+        # Earlier submissions of all the photos are looked up at once
+        self.assertEqual(len([q for q in ctx.captured_queries if ">>" in q["sql"]]), 1)
+
+    @override_settings(DUPLICATE_SUBMISSIONS="reject")
+    def test_rejected(self):
+        self.assertEqual(self.submit(make_photo(1)).status_code, 201)
+        response = self.submit(make_photo(1, (800, 600)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already submitted", response.json()["image"][0])
+        self.assertEqual(m.PhotoSubmission.objects.count(), 1)
+
+    @mock.patch.object(drive, "storage")
+    @mock.patch.object(images, "download_original", side_effect=lambda image_id, service: make_photo(int(image_id[-1])))
+    def test_backfill(self, download_original, drive_storage):
+        m.PhotoSubmission.objects.bulk_create(
+            m.PhotoSubmission(score=0, image=f"photo{i}.jpg", image_id=f"id{i}") for i in (1, 2, 1)
+        )
+        call_command("hash_submissions", workers=2, stdout=StringIO())
+        first, other, resubmitted = m.PhotoSubmission.objects.order_by("id")
+        self.assertIsNotNone(first.image_hash)
+        self.assertEqual([first.duplicate_of, other.duplicate_of, resubmitted.duplicate_of], [None, None, first])
+
+
+class RescoreTests(TestCase):
+    """
+    Scores are calculated with the latest scoring rules, and can be recalculated in bulk when the rules change
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.red = m.Family.objects.create(fam_name="Red")
+        cls.alice = m.Member.objects.create(first_name="Alice", family=cls.red)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def add_version(self, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for rule in m.ScoringRule.objects.filter(version=1):
+                rule.pk, rule.version = None, 2
+                rule.per_person, rule.people_offset, rule.base = changes.get(rule.description, (rule.per_person, rule.people_offset, rule.base))
+                rule.save()
+            # The cached rules are only dropped once the new version is committed
+            self.assertEqual(m.ScoringRule.objects.current()[0], 1)
+
+    def test_rules_match_the_old_scoring(self):
+        expected = {"ssa": 30, "random": 4, "fun": 10, "single": 20, "crossover": 40, "": 0}
+        for description, score in expected.items():
+            submission = m.PhotoSubmission.objects.create(member=self.alice, description=description, number_of_people=3)
+            self.assertEqual((description, submission.score, submission.scoring_version), (description, score, 1))
+
+    def test_new_rules_apply_to_new_submissions(self):
+        m.ScoringRule.objects.current()
+        self.add_version(random=(3, 0, 1))
+        submission = m.PhotoSubmission.objects.create(member=self.alice, description="random", number_of_people=3)
+        self.assertEqual((submission.score, submission.scoring_version), (10, 2))
+
+    def test_rescore(self):
+        calculated = m.PhotoSubmission.objects.create(member=self.alice, description="random", number_of_people=3)
+        manual = m.PhotoSubmission.objects.create(member=self.alice, description="random", number_of_people=3, score=100)
+        edited = m.PhotoSubmission.objects.get(pk=m.PhotoSubmission.objects.create(
+            member=self.alice, description="random", number_of_people=3).pk)
+        edited.score = 50
+        edited.save()
+        self.assertEqual(edited.scoring_version, None)
+        self.add_version(random=(3, 0, 1))
+
+        out = StringIO()
+        call_command("rescore_submissions", dry_run=True, stdout=out)
+        self.assertIn("Red: 4 -> 10 (+6)", out.getvalue())
+        calculated.refresh_from_db()
+        self.assertEqual(calculated.score, 4)
+
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("rescore_submissions", stdout=StringIO())
+        # Rescored in the database, not row by row
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "backend_photosubmission"')]
+        self.assertEqual(len(updates), 1)
+        scores = dict(m.PhotoSubmission.objects.values_list("pk", "score"))
+        self.assertEqual([scores[calculated.pk], scores[manual.pk], scores[edited.pk]], [10, 100, 50])
+        call_command("rebuild_leaderboard", check=True, stdout=StringIO())
+        self.assertEqual(m.Family.objects.get().points, 160)
+
+
+class SubmissionAdminTests(TestCase):
+    """
+    The submission changelist takes a fixed number of queries, and estimates the count of large tables
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        families = [m.Family.objects.create(fam_name=f"Family {i}") for i in range(3)]
+        members = [m.Member.objects.create(first_name=f"Member {i}", family=families[i % 3]) for i in range(6)]
+        cls.submissions = m.PhotoSubmission.objects.bulk_create(
+            m.PhotoSubmission(member=members[i % 6], family=families[i % 3], score=1, description="fun") for i in range(60)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get_changelist(self, query=""):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/admin/backend/photosubmission/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def test_fixed_number_of_queries(self):
+        _, few = self.get_changelist("?id__lte=" + str(self.submissions[4].pk))
+        _, many = self.get_changelist()
+        self.assertEqual(len(few), len(many))
+
+    @mock.patch("backend.admin.pagination.EstimatedCountPaginator.threshold", 10)
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE backend_photosubmission")
+        response, queries = self.get_changelist("?family__id__exact=" + str(self.submissions[0].family_id))
+        self.assertFalse([q for q in queries if "COUNT(" in q and "backend_photosubmission" in q])
+        self.assertEqual(len(response.context["cl"].result_list), 20)
+
+
+class FamilyAdminTests(TestCase):
+    """
+    The family changelist is sorted by the stored points, which can be rebuilt from the admin
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.families = [m.Family.objects.create(fam_name=f"Family {i}") for i in range(4)]
+        for i, family in enumerate(cls.families):
+            m.PhotoSubmission.objects.create(family=family, score=i)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist(self):
+        # Session, user, two counts and the page: nothing per family
+        with self.assertNumQueries(5):
+            response = self.client.get("/admin/backend/family/")
+        self.assertEqual(
+            [family.fam_name for family in response.context["cl"].result_list],
+            ["Family 3", "Family 2", "Family 1", "Family 0"],
+        )
+
+    def test_rebuild_action(self):
+        m.Family.objects.update(points=0)
+        response = self.client.post("/admin/backend/family/", {
+            "action": "rebuild_points", "_selected_action": [family.pk for family in self.families],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(m.Family.objects.values_list("points", flat=True)), [0, 1, 2, 3])
+        self.assertContains(self.client.get(f"/admin/backend/family/{self.families[2].pk}/change/"), "Points from submissions")
+
+
+class MemberPickerTests(TestCase):
+    """
+    The family and event member pickers render only the chosen members and search the rest on the server
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.family = m.Family.objects.create(fam_name="Family")
+        cls.members = [
+            m.Member.objects.create(first_name=f"Member{i:02}", telegram_username=f"handle{i}", family=cls.family if i < 2 else None)
+            for i in range(60)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_search(self):
+        response = self.client.get("/admin/backend/member/search/").json()
+        self.assertEqual(len(response["results"]), 50)
+        self.assertTrue(response["more"])
+        response = self.client.get("/admin/backend/member/search/", {"page": 2}).json()
+        self.assertEqual([result["text"] for result in response["results"]][0], "Member50")
+        self.assertFalse(response["more"])
+        response = self.client.get("/admin/backend/member/search/", {"term": "HANDLE7"}).json()
+        self.assertEqual([result["id"] for result in response["results"]], [self.members[7].pk])
+
+    def test_renders_chosen_members(self):
+        content = self.client.get(f"/admin/backend/family/{self.family.pk}/change/").content.decode()
+        self.assertIn("Member01", content)
+        self.assertNotIn("Member02", content)
+        event = m.Event.objects.create(title="Event", start_date=datetime(2024, 1, 1, tzinfo=timezone.utc), venue="Venue")
+        event.participants.add(self.members[5])
+        content = self.client.get(f"/admin/backend/event/{event.pk}/change/").content.decode()
+        self.assertIn("Member05", content)
+        self.assertNotIn("Member06", content)
+
+    def test_save_members(self):
+        form = f.FamilyForm(
+            {"fam_name": "Family", "points_adjustment": 0, "members": [self.members[1].pk, self.members[2].pk]},
+            instance=self.family,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(
+            set(self.family.members.values_list("pk", flat=True)), {self.members[1].pk, self.members[2].pk}
+        )
+
+
+class ParticipantExportTests(TestCase):
+    """
+    Participant exports cover every selected event, and CSV and XLSX files are streamed
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.events = [
+            m.Event.objects.create(title=f"Event {i}", start_date=datetime(2024, 1, i + 1, 12, tzinfo=timezone.utc), venue="Venue")
+            for i in range(2)
+        ]
+        members = [m.Member.objects.create(first_name=f"Member{i}", telegram_username=f"handle{i}") for i in range(3)]
+        cls.events[0].participants.add(*members[:2])
+        cls.events[1].participants.add(*members[1:])
+
+    def export(self, file_format):
+        request = RequestFactory().post("/admin/backend/event/export/")
+        request.user = self.admin
+        return admin.site._registry[m.Event]._do_file_export(file_format, request, m.Event.objects.all())
+
+    def test_csv(self):
+        response = self.export(base_formats.CSV())
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["Event", "Event date", "First name", "Last name", "Dob", "Email", "Telegram username"])
+        self.assertEqual([(row[0], row[1], row[2]) for row in rows[1:]], [
+            ("Event 0", "2024-01-01", "Member0"), ("Event 0", "2024-01-01", "Member1"),
+            ("Event 1", "2024-01-02", "Member1"), ("Event 1", "2024-01-02", "Member2"),
+        ])
+
+    def test_xlsx(self):
+        response = self.export(base_formats.XLSX())
+        self.assertTrue(response.streaming)
+        sheet = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        rows = list(sheet.values)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[4][:3], ("Event 1", datetime(2024, 1, 2), "Member2"))
+
+    def test_other_formats(self):
+        response = self.export(base_formats.JSON())
+        self.assertEqual(len(json.loads(response.content)), 4)
+
+
+class MemberImportTests(TestCase):
+    """
+    Member rosters are imported in bulk, in the background
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.members = [m.Member.objects.create(first_name=f"Member{i}", email=f"member{i}@example.com") for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def roster(self, rows):
+        lines = ["id,first_name,last_name,email"] + [",".join(row) for row in rows]
+        return SimpleUploadedFile("roster.csv", "\n".join(lines).encode(), content_type="text/csv")
+
+    def test_bulk_import(self):
+        dataset = tablib.Dataset(headers=["id", "first_name", "email"])
+        for member in self.members:
+            dataset.append([member.pk, f"Renamed{member.pk}", member.email])
+        dataset.append(["", "New", "new@example.com"])
+        # Existing members are loaded with one query, then one bulk insert and one bulk update,
+        # plus the id sequence reset import-export does after imports on postgres
+        with self.assertNumQueries(4):
+            result = r.MemberBulkResource().import_data(dataset, use_transactions=False)
+        self.assertFalse(result.has_errors())
+        self.assertEqual(m.Member.objects.filter(first_name__startswith="Renamed").count(), 3)
+        self.assertTrue(m.Member.objects.filter(first_name="New").exists())
+
+    def test_background_import(self):
+        response = self.client.get("/admin/backend/member/")
+        self.assertContains(response, "/admin/backend/member/import-background/")
+
+        rows = [(str(member.pk), "Renamed", "", member.email) for member in self.members]
+        rows += [("", f"New{i}", "", f"new{i}@example.com") for i in range(4)]
+        response = self.client.post(
+            "/admin/backend/member/import-background/", {"import_file": self.roster(rows), "format": "CSV"},
+        )
+        job = m.Job.objects.get(kind="import_members")
+        self.assertRedirects(response, f"/admin/backend/job/{job.pk}/change/")
+        self.assertEqual((job.progress, job.total), (0, 7))
+
+        with mock.patch.object(jobs, "IMPORT_CHUNK_SIZE", 3):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), ("done", 7))
+        self.assertEqual(m.Member.objects.filter(first_name="Renamed").count(), 3)
+        self.assertEqual(m.Member.objects.filter(first_name__startswith="New").count(), 4)
+        self.assertContains(self.client.get(f"/admin/backend/job/{job.pk}/change/"), "7/7")
+
+    def test_failed_chunk(self):
+        rows = [("", f"New{i}", "", f"new{i}@example.com") for i in range(3)]
+        rows += [("", "Clash", "", self.members[0].email)]
+        self.client.post("/admin/backend/member/import-background/", {"import_file": self.roster(rows), "format": "CSV"})
+        with mock.patch.object(jobs, "IMPORT_CHUNK_SIZE", 3):
+            jobs.run_pending()
+        job = m.Job.objects.get(kind="import_members")
+        # The first chunk went through, the failing one was rolled back. It would fail the same way again, so no retry.
+        self.assertEqual((job.status, job.attempts, job.progress), ("failed", 1, 3))
+        self.assertIn("no rows from row 4 on were imported", job.last_error)
+        self.assertFalse(m.Member.objects.filter(first_name="Clash").exists())
+
+    def test_rejects_unreadable_file(self):
+        upload = SimpleUploadedFile("roster.csv", b"first_name\nSomeone", content_type="text/csv")
+        response = self.client.post("/admin/backend/member/import-background/", {"import_file": upload, "format": "CSV"})
+        self.assertContains(response, "The file needs an id column")
+        self.assertFalse(m.Job.objects.exists())
+
+
+@override_settings(ASGI=True)
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class AsyncReadTests(TestCase):
+    """
+    Under ASGI the hot read endpoints are answered by async views, which pass anything else on to the sync views
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.family = m.Family.objects.create(fam_name="Red")
+        cls.alice = m.Member.objects.create(first_name="Alice", telegram_username="Alice", family=cls.family)
+        event = m.Event.objects.create(
+            title="Welcome tea", start_date=datetime(2024, 9, 1, tzinfo=timezone.utc), venue="Ackerman", visible=True,
+        )
+        event.participants.add(cls.alice)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_list(self):
+        expected = (await self.async_client.get("/families/", headers={"Authorization": "api-key key"})).content
+        await cache.aclear()
+
+        view = v.FamilyViewSet.as_view({"get": "list"})
+        with mock.patch.object(v.FamilyViewSet, "list", side_effect=AssertionError("answered by the sync view")):
+            response = await view(AsyncRequestFactory().get("/families/", headers={"Authorization": "api-key key"}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected)
+            # Then from the response cache, updates don't invalidate it
+            await m.Family.objects.aupdate(fam_name="Blue")
+            response = await view(AsyncRequestFactory().get("/families/", headers={"Authorization": "api-key key"}))
+            self.assertEqual(response.content, expected)
+
+    async def test_streamed_list(self):
+        view = v.EventViewSet.as_view({"get": "list", "post": "create"})
+        response = await view(AsyncRequestFactory().get("/events/"))
+        # Streamed through the async ORM, like the sync view streams it
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([event["title"] for event in json.loads(content)], ["Welcome tea"])
+
+        # Cached once sent
+        response = await view(AsyncRequestFactory().get("/events/"))
+        self.assertEqual(response.content, content)
+        response = await view(AsyncRequestFactory().get("/events/", headers={"If-None-Match": response["ETag"]}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_retrieve(self):
+        view = v.MemberUsernameViewSet.as_view({"get": "retrieve", "patch": "partial_update"})
+        request = AsyncRequestFactory().get("/members/u/alice/", headers={"Authorization": "api-key key"})
+        with mock.patch.object(v.MemberUsernameViewSet, "retrieve", side_effect=AssertionError("answered by the sync view")):
+            response = await view(request, telegram_username__lower_exact="alice")
+        response.render()
+        self.assertEqual(json.loads(response.content)["events"], ["Welcome tea"])
+        self.assertEqual(json.loads(response.content)["family"], "Red")
+
+        request = AsyncRequestFactory().get("/members/u/bob/", headers={"Authorization": "api-key key"})
+        response = await view(request, telegram_username__lower_exact="bob")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_falls_back_to_sync_view(self):
+        # Paginated lists, denied requests and writes go to the sync view
+        view = v.EventViewSet.as_view({"get": "list", "post": "create"})
+        response = await view(AsyncRequestFactory().get("/events/", headers={"Authorization": "api-key key"}))
+        response.render()
+        self.assertIn("results", json.loads(response.content))
+        view = v.FamilyViewSet.as_view({"get": "list"})
+        response = await view(AsyncRequestFactory().get("/families/"))
+        self.assertEqual(response.status_code, 403)
+        view = v.ExcoViewSet.as_view({"get": "list", "post": "create"})
+        response = await view(AsyncRequestFactory().post("/exco/", {}))
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncImageProxyTests(TransactionTestCase):
+    """
+    Under ASGI the image proxy downloads and renders images on the drive pool.
+    A TransactionTestCase, since the pool threads have their own database connections.
+    """
+    def setUp(self):
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        self.enterContext(override_settings(IMAGE_CACHE_ROOT=cache_root.name))
+
+    async def test_image_proxy_downloads_on_drive_pool(self):
+        await m.ExcoMember.objects.acreate(id=1, name="Alice", role="President", year="4", major="CS", photo_id="abc123")
+
+        threads = []
+        def download(image_id):
+            threads.append(threading.current_thread().name)
+            return make_jpeg()
+
+        with mock.patch.object(images, "download_original", side_effect=download):
+            response = await v.image_variant_async(AsyncRequestFactory().get("/images/abc123/thumb/"), "abc123", "thumb")
+            self.assertEqual(response.status_code, 200)
+            # Cached variants are served without going to the pool
+            await v.image_variant_async(AsyncRequestFactory().get("/images/abc123/medium/"), "abc123", "medium")
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("drive"))
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "key"})
+class PoolStatsTests(TestCase):
+    """
+    The connection pool statistics are served to api key holders and staff
+    """
+    def test_permissions(self):
+        self.assertEqual(self.client.get("/internal/db-pool/").status_code, 403)
+        response = self.client.get("/internal/db-pool/", HTTP_AUTHORIZATION="api-key key")
+        self.assertEqual(response.json(), {"pooling": False})
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.assertEqual(self.client.get("/internal/db-pool/").status_code, 200)
+
+    def test_stats(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            "pool_min": 2, "pool_max": 10, "pool_size": 6, "pool_available": 1,
+            "requests_waiting": 3, "requests_queued": 4, "requests_wait_ms": 200,
+        }
+        with mock.patch.object(type(connections["default"]), "pool", new_callable=mock.PropertyMock, return_value=pool):
+            response = self.client.get("/internal/db-pool/", HTTP_AUTHORIZATION="api-key key").json()
+        self.assertEqual(
+            (response["in_use"], response["waiting"], response["average_wait_ms"]), (5, 3, 50),
+        )
+        self.assertEqual(response["stats"]["pool_max"], 10)
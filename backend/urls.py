@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import include, path
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import routers
@@ -16,6 +17,12 @@ router.register(r"exco", v.ExcoViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path(
+        "images/<slug:image_id>/<slug:variant>/",
+        v.image_variant_async if settings.ASGI else v.image_variant,
+        name="image-variant",
+    ),
+    path("internal/db-pool/", v.db_pool_stats, name="db-pool-stats"),
     path('dj-rest-auth/google/', v.GoogleLogin.as_view(),
          name='google_login'),
     path('dj-rest-auth/google/connect',
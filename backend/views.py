@@ -1,38 +1,98 @@
-from rest_framework import viewsets, mixins, filters
-from backend import serializers as s, models as m
+from rest_framework import viewsets, mixins, filters, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from backend import serializers as s, models as m, images, drive
+from .caching import ConditionalGetMixin, ResponseCacheMixin
+from .streaming import StreamingListMixin
+from .asyncviews import AsyncReadMixin
 from . import permissions as p
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import connection
 from zoneinfo import ZoneInfo
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter, LoginByTokenView
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from allauth.socialaccount.helpers import complete_social_login
 from allauth.account.utils import get_next_redirect_url
 from dj_rest_auth.registration.views import SocialLoginView, SocialConnectView
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from googleapiclient.errors import HttpError
+from PIL import UnidentifiedImageError
 
 
 class EventViewSetPagination(PageNumberPagination):
     """
-    Pagination class to support pagination for telebot's /get_event_photodump command
+    Pagination class to support pagination for telebot's /get_event_photodump command.
+    Kept for clients that still page by number, see EventViewSet.paginator.
     """
     page_size = 20
     page_size_query_param = "page_size"
     max_page_size = 100
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSetCursorPagination(CursorPagination):
+    """
+    Cursor pagination for telebot's /get_event_photodump command.
+    Pages are read straight off the (start_date, id) index without counting the events,
+    and do not shift when events are added while paging through them.
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ('-start_date', '-id')
+
+
+class EventViewSet(ConditionalGetMixin, ResponseCacheMixin, StreamingListMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     Event viewset. Behaviour is as follows:
     If an api key is not provided, uses the EventPublicSerializer and forbids unsafe methods. (this is for the website)
+    Responses then carry an ETag/Last-Modified, so repeat visitors get cheap 304s.
     If an api key is provided and is valid, uses the EventAPISerializer instead. (this is for the telebot)
+    Those responses are paginated with cursors, or with page numbers if asked for.
+    Rendered responses of both are cached until an event changes.
+    The unpaginated public list is streamed rather than rendered in one go.
+    Under ASGI, the public endpoints are answered by async views.
     """
     queryset = m.Event.objects.filter(visible=True)
     permission_classes = [p.IsAdminOrReadOnly]
     serializer_class = s.EventPublicSerializer
     filter_backends = [filters.OrderingFilter]
-    ordering = '-start_date'
-    pagination_class = EventViewSetPagination
+    ordering = ('-start_date', '-id')
+    pagination_class = EventViewSetCursorPagination
+    version_scopes = ("events",)
+
+    # only the public list is unpaginated
+    def use_streaming_list(self, request):
+        return not request.META.get("HTTP_AUTHORIZATION", None) and super().use_streaming_list(request)
+
+    # for the same reason, only the public endpoints are read asynchronously
+    def use_async_read(self, request):
+        return not request.META.get("HTTP_AUTHORIZATION", None)
+
+    # page numbers are used instead of cursors if asked for with ?pagination=page, or if a page number is given
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get("pagination") == "page" or "page" in params:
+                self._paginator = EventViewSetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    # the api key endpoint shows a sliding window of events, so it can't be validated by the version alone
+    def use_conditional_get(self, request):
+        return not request.META.get("HTTP_AUTHORIZATION", None)
+
+    # for the same reason, only cache its responses briefly
+    def get_response_cache_timeout(self, request):
+        if request.META.get("HTTP_AUTHORIZATION", None):
+            return 60
+        return super().get_response_cache_timeout(request)
 
     def get_permissions(self):
         if self.request.META.get("HTTP_AUTHORIZATION", None):
@@ -65,26 +125,28 @@ class EventViewSet(viewsets.ModelViewSet):
         return super().get_queryset()
 
 
-class FamilyViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
+class FamilyViewSet(ResponseCacheMixin, AsyncReadMixin, viewsets.GenericViewSet, mixins.ListModelMixin):
     """
     Family viewset. Leaderboard only
     """
     queryset = m.Family.objects.all()
     serializer_class = s.FamilySerializer
     permission_classes = [p.HasAPIAccess]
+    version_scopes = ("families",)
 
 
-class MemberUsernameViewSet(viewsets.GenericViewSet,
+class MemberUsernameViewSet(AsyncReadMixin,
+                            viewsets.GenericViewSet,
                             mixins.RetrieveModelMixin,
                             mixins.UpdateModelMixin):
     """
     Member viewset for telebot. Lookup using telegram handle.
     Case insensitive to accommodate for data entry inconsistencies.
     """
-    queryset = m.Member.objects.all()
+    queryset = m.Member.objects.select_related("family").prefetch_related("events")
     serializer_class = s.MemberSerializer
     permission_classes = [p.HasAPIAccess]
-    lookup_field = "telegram_username__iexact"
+    lookup_field = "telegram_username__lower_exact"
 
 
 class MemberIDViewset(MemberUsernameViewSet):
@@ -102,6 +164,17 @@ class PhotoSubmissionViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin):
     serializer_class = s.PhotoSubmissionSerializer
     permission_classes = [p.HasAPIAccess]
 
+    @action(detail=False, methods=["post"], serializer_class=s.PhotoSubmissionBatchSerializer)
+    def batch(self, request):
+        """
+        Create many submissions in one request, e.g. for an album.
+        Responds with the created submissions in the order they were sent.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        submissions = serializer.save()
+        return Response(s.PhotoSubmissionItemSerializer(submissions, many=True).data, status=status.HTTP_201_CREATED)
+
 
 class GroupChatViewSet(viewsets.ModelViewSet):
     """
@@ -112,13 +185,100 @@ class GroupChatViewSet(viewsets.ModelViewSet):
     permission_classes = [p.HasAPIAccess]
 
 
-class ExcoViewSet(viewsets.ModelViewSet):
+class ExcoViewSet(ConditionalGetMixin, ResponseCacheMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     Viewset for exco members
     """
     queryset = m.ExcoMember.objects.order_by("id")
     serializer_class = s.ExcoSerializer
     permission_classes = [p.IsAdminOrReadOnly]
+    version_scopes = ("exco",)
+
+
+def variant_etag(request, image_id, variant):
+    """
+    Format to serve an image variant in, webp if the client accepts it and jpeg otherwise, and its ETag
+    """
+    if variant not in images.VARIANTS:
+        raise Http404("Unknown image variant")
+
+    fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    return fmt, images.etag(image_id, variant, fmt)
+
+
+def render_variant(image_id, variant, fmt):
+    try:
+        return images.render_variant(image_id, variant, fmt)
+    except HttpError as e:
+        if e.resp.status == 404:
+            raise Http404("Image not found on google drive")
+        raise
+    except UnidentifiedImageError:
+        raise Http404("Not an image")
+
+
+def variant_response(file, fmt, etag, response=None):
+    """
+    Response with an image variant, or the given 304 response, cacheable forever
+    """
+    if response is None:
+        response = FileResponse(file, content_type=images.FORMATS[fmt][1])
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    response["Vary"] = "Accept"
+    return response
+
+
+@require_safe
+def image_variant(request, image_id, variant):
+    """
+    Image proxy. Serves a resized copy of a google drive image (see backend/images.py),
+    as webp if the client accepts it and jpeg otherwise.
+    Variants never change for a given url, so they can be cached by browsers and CDNs indefinitely.
+    """
+    fmt, etag = variant_etag(request, image_id, variant)
+    if response := get_conditional_response(request, etag=etag):
+        return variant_response(None, fmt, etag, response)
+
+    file = images.open_cached_variant(image_id, variant, fmt) or render_variant(image_id, variant, fmt)
+    return variant_response(file, fmt, etag)
+
+
+@require_safe
+async def image_variant_async(request, image_id, variant):
+    """
+    Image proxy for ASGI. Cached variants are served straight away, others are downloaded and rendered
+    on the drive pool, so that slow downloads from google drive don't hold anything else up.
+    """
+    fmt, etag = variant_etag(request, image_id, variant)
+    if response := get_conditional_response(request, etag=etag):
+        return variant_response(None, fmt, etag, response)
+
+    file = images.open_cached_variant(image_id, variant, fmt) or await drive.run(render_variant, image_id, variant, fmt)
+    return variant_response(file, fmt, etag)
+
+
+@api_view(["GET"])
+@permission_classes([p.HasAPIAccess | IsAdminUser])
+def db_pool_stats(request):
+    """
+    Statistics of this process's database connection pool (settings.DATABASE_POOL),
+    for sizing the number of workers against postgres' connection limit.
+    Each worker process has its own pool, counters add up from when the process started.
+    """
+    pool = connection.pool
+    if pool is None:
+        return Response({"pooling": False})
+
+    stats = pool.get_stats()
+    queued = stats.get("requests_queued", 0)
+    return Response({
+        "pooling": True,
+        "in_use": stats["pool_size"] - stats["pool_available"],
+        "waiting": stats.get("requests_waiting", 0),
+        "average_wait_ms": stats.get("requests_wait_ms", 0) / queued if queued else 0,
+        "stats": stats,
+    })
 
 
 class CompatibleOAuth2Client(OAuth2Client):
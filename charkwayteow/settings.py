@@ -20,8 +20,9 @@ env = environ.Env(
     RAILWAY_PUBLIC_DOMAIN=(str, "")
 )
 environ.Env.read_env()
-os.environ["LOGIN_URI"] = f"https://{domain}" if (
+PUBLIC_URL = f"https://{domain}" if (
     domain := env("RAILWAY_PUBLIC_DOMAIN")) else "http://localhost:8000"
+os.environ["LOGIN_URI"] = PUBLIC_URL
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -98,17 +99,47 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'charkwayteow.wsgi.application'
 
+# Set when serving through ASGI (uvicorn workers, see gunicorn.conf.py).
+# The hot read endpoints are then answered by async views (backend/asyncviews.py)
+ASGI = env.bool('ASGI', default=False)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# With DATABASE_POOL set, each process keeps a psycopg connection pool shared by its threads,
+# bounding its connections to DATABASE_POOL_MAX_SIZE. Its statistics are served at /internal/db-pool/.
+DATABASE_POOL = env.bool('DATABASE_POOL', default=False)
+
 DATABASES = {
     'default': dj_database_url.config(
         default=env('DATABASE_URL'),
-        conn_max_age=500,
+        # Under ASGI, Django runs the sync code of each request (sync views, async ORM calls) on a thread made for
+        # that request, so a persistent connection would be left behind with the thread instead of reused.
+        # Pooled connections go back to the pool instead.
+        conn_max_age=0 if ASGI or DATABASE_POOL else 500,
         conn_health_checks=True
     )
 }
+if DATABASE_POOL:
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=10),
+        # Seconds to wait for a free connection before failing the request
+        'timeout': env.float('DATABASE_POOL_TIMEOUT', default=10),
+        # Seconds before idle connections above min_size are closed
+        'max_idle': env.float('DATABASE_POOL_MAX_IDLE', default=600),
+    }
+
+
+# Cache
+# Shared by every process of the web service and the job worker, since it holds the version stamps used to
+# validate responses (backend/caching.py), which the worker bumps after uploads and folder provisioning.
+# Defaults to a table in the database (made by `manage.py createcachetable`), set CACHE_URL to use e.g. redis instead.
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='dbcache://charkwayteow_cache?max_entries=5000')
+}
 
 
 # Password validation
@@ -169,3 +200,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE = None
 GOOGLE_DRIVE_STORAGE_MEDIA_ROOT = 'django'
 GOOGLE_DRIVE_PHOTODUMP_FOLDER = 'event_photodumps'
+
+# Resized image variants served by the image proxy (backend/images.py)
+IMAGE_CACHE_ROOT = env('IMAGE_CACHE_ROOT', default=str(BASE_DIR / 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = env.int('IMAGE_CACHE_MAX_BYTES', default=512 * 1024 * 1024)
+
+# Threads for blocking google drive calls made while serving async requests (backend/drive.py)
+DRIVE_THREADS = env.int('DRIVE_THREADS', default=8)
+
+# What to do with photo submissions of a photo that was already submitted (backend/phash.py):
+# "flag" accepts them with duplicate_of set for the admins to review, "reject" refuses them at the api
+DUPLICATE_SUBMISSIONS = env('DUPLICATE_SUBMISSIONS', default='flag')
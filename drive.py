@@ -1,5 +1,6 @@
-import os, shlex
+import os, shlex, time
 from copy import copy
+from fnmatch import fnmatchcase
 from googleapiclient.errors import HttpError
 from gdstorage.storage import GoogleDriveStorage as gds
 os.environ["DJANGO_SETTINGS_MODULE"] = "charkwayteow.settings"
@@ -8,6 +9,8 @@ os.environ["DJANGO_SETTINGS_MODULE"] = "charkwayteow.settings"
 This is a simple tool to manage the service account drive connected to the project.
 It starts you off in the root of the filesystem (basically "my drive").
 Use the `ls` and `cd` commands to navigate the drive and `rm` to remove any unneeded files and directories.
+`rm` and `mv` accept glob patterns (e.g. `rm 2023*`) and `-n` to preview what they would do.
+Bulk operations are sent through the drive batch endpoint, up to 100 files per request.
 """
 
 class bcolors:
@@ -23,9 +26,17 @@ class bcolors:
 
 
 class DriveManager:
+    # Seconds a cached folder id is trusted for, the drive can be changed from elsewhere in the meantime
+    CACHE_TTL = 300
+    PAGE_SIZE = 1000
+    # Maximum number of calls google allows in one batch request
+    BATCH_SIZE = 100
+
     def __init__(self):
         self.s = gds()._drive_service
         self.context = []
+        # (parent folder id, folder name) -> (folder id, expiry time)
+        self.folder_ids = {}
     
     def curr_folder_id(self, context = None):
         if context is None:
@@ -46,11 +57,77 @@ class DriveManager:
             case 2:
                 return split_name
     
+    def quote(self, name):
+        """
+        Escape a file name for use in a drive query
+        """
+        return name.replace("\\", "\\\\").replace("'", "\\'")
+
+    def list_files(self, q, fields="id, name, mimeType"):
+        """
+        Yield every file matching the query, following all result pages
+        """
+        page_token = None
+        while True:
+            res = self.s.files().list(
+                q=q,
+                fields=f"nextPageToken, files({fields})",
+                pageSize=self.PAGE_SIZE,
+                pageToken=page_token,
+            ).execute()
+            yield from res.get("files", [])
+            page_token = res.get("nextPageToken")
+            if not page_token:
+                return
+
+    def find_file(self, parent_id, name, fields="id, name, mimeType"):
+        """
+        Get the first file with this name in the parent folder, or None
+        """
+        res = self.s.files().list(
+            q=f"name = '{self.quote(name)}' and '{parent_id}' in parents",
+            fields=f"files({fields})",
+            pageSize=1,
+        ).execute()
+        return res["files"][0] if res["files"] else None
+
+    def cache_folder(self, parent_id, name, folder_id):
+        self.folder_ids[(parent_id, name)] = (folder_id, time.monotonic() + self.CACHE_TTL)
+
+    def lookup_folder(self, parent_id, name):
+        """
+        Get the id of the folder with this name in the parent folder, or None.
+        Results are cached for CACHE_TTL seconds.
+        """
+        cached = self.folder_ids.get((parent_id, name))
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        res = self.s.files().list(
+            q=f"name = '{self.quote(name)}' and mimeType = '{gds._GOOGLE_DRIVE_FOLDER_MIMETYPE_}' and '{parent_id}' in parents",
+            fields="files(id)",
+            pageSize=1,
+        ).execute()
+        if not res["files"]:
+            self.folder_ids.pop((parent_id, name), None)
+            return None
+        folder_id = res["files"][0]["id"]
+        self.cache_folder(parent_id, name, folder_id)
+        return folder_id
+
+    def forget_folder(self, folder_id):
+        """
+        Drop a removed or moved folder, and the folders looked up inside it, from the cache
+        """
+        for key, (cached_id, _) in list(self.folder_ids.items()):
+            if cached_id == folder_id or key[0] == folder_id:
+                del self.folder_ids[key]
+
     def ls(self):
-        res = self.s.files().list(q=f"'{self.curr_folder_id()}' in parents").execute()
-        for file in res["files"]:
+        folder_id = self.curr_folder_id()
+        for file in self.list_files(f"'{folder_id}' in parents"):
             name = file["name"]
             if self.is_directory(file):
+                self.cache_folder(folder_id, file["name"], file["id"])
                 name += "/"
             print(name)
 
@@ -82,11 +159,11 @@ class DriveManager:
                 case ".":
                     pass
                 case _:
-                    res = self.s.files().list(q=f"name = '{name}' and mimeType = '{gds._GOOGLE_DRIVE_FOLDER_MIMETYPE_}' and '{self.curr_folder_id(new_context)}' in parents").execute()
-                    if len(res["files"]) == 0:
+                    folder_id = self.lookup_folder(self.curr_folder_id(new_context), name)
+                    if folder_id is None:
                         error = True
                         break
-                    new_context.append((name, res["files"][0]["id"]))
+                    new_context.append((name, folder_id))
         if error:
             print(f"No such directory: {name}")
         else:
@@ -94,33 +171,95 @@ class DriveManager:
             context.extend(new_context)
         return not error
 
-    def rm(self, files):
-        for file in files:
-            dirname, filename = self.parse_filename(file)
+    def confirm(self, prompt):
+        while True:
+            decision = input(f"{prompt} y/N: ")
+            match decision:
+                case "Y" | "y" | "yes":
+                    return True
+                case "N" | "n" | "no" | "":
+                    return False
+
+    def split_flags(self, args):
+        """
+        Separate the -n/--dry-run flag from the arguments
+        """
+        dry_run = any(arg in ("-n", "--dry-run") for arg in args)
+        return dry_run, [arg for arg in args if arg not in ("-n", "--dry-run")]
+
+    def resolve(self, patterns, fields="id, name, mimeType"):
+        """
+        Expand file names and glob patterns into the matching files, in order and without duplicates
+        """
+        matches = {}
+        for pattern in patterns:
+            dirname, filename = self.parse_filename(pattern)
             context = copy(self.context)
             if not self.cd(dirname, context):
                 continue
-            res = self.s.files().list(q=f"name = '{filename}' and '{self.curr_folder_id(context)}' in parents").execute()
-            if len(res["files"]) == 0:
+            folder_id = self.curr_folder_id(context)
+            if any(c in filename for c in "*?["):
+                found = [f for f in self.list_files(f"'{folder_id}' in parents", fields) if fnmatchcase(f["name"], filename)]
+            else:
+                found = [f] if (f := self.find_file(folder_id, filename, fields)) else []
+            if not found:
                 print(f"No such file: {filename}")
-                continue
-            file_data = res["files"][0]
-            if self.is_directory(file_data):
-                while True:
-                    decision = input(f"{filename} is a directory. Confirm delete? y/N: ")
-                    match decision:
-                        case "Y" | "y" | "yes":
-                            remove = True
-                            break
-                        case "N" | "n" | "no" | "":
-                            remove = False
-                            break
+            for file in found:
+                matches.setdefault(file["id"], file)
+        return list(matches.values())
+
+    def batch_execute(self, requests):
+        """
+        Send (file, request) pairs through the batch endpoint, BATCH_SIZE at a time.
+        Returns the (file, error) pairs of the requests that failed.
+        """
+        failures = []
+        for i in range(0, len(requests), self.BATCH_SIZE):
+            chunk = requests[i:i + self.BATCH_SIZE]
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    failures.append((chunk[int(request_id)][0], exception))
+
+            batch = self.s.new_batch_http_request(callback=callback)
+            for j, (_, request) in enumerate(chunk):
+                batch.add(request, request_id=str(j))
+            batch.execute()
+        return failures
+
+    def report(self, command, files, failures):
+        for file, error in failures:
+            print(f"{bcolors.FAIL}{command}: {file['name']}: {getattr(error, 'reason', error)}{bcolors.ENDC}")
+        failed = {file["id"] for file, _ in failures}
+        for file in files:
+            if file["id"] not in failed:
+                self.forget_folder(file["id"])
+        if len(files) > 1:
+            print(f"{command}: {len(files) - len(failures)} of {len(files)} done")
+
+    def rm(self, args):
+        dry_run, patterns = self.split_flags(args)
+        files = self.resolve(patterns)
+
+        directories = [file for file in files if self.is_directory(file)]
+        if directories and not dry_run:
+            if len(directories) == 1:
+                prompt = f"{directories[0]['name']} is a directory. Confirm delete?"
             else:
-                remove = True
-            if remove:
-                self.s.files().delete(fileId=file_data["id"]).execute()
+                prompt = f"{len(directories)} of the matches are directories. Confirm delete?"
+            if not self.confirm(prompt):
+                files = [file for file in files if not self.is_directory(file)]
 
-    def mv(self, files):
+        if dry_run:
+            for file in files:
+                print(f"would remove {file['name']}{'/' if self.is_directory(file) else ''}")
+            return
+
+        requests = [(file, self.s.files().delete(fileId=file["id"])) for file in files]
+        self.report("rm", files, self.batch_execute(requests))
+
+    def mv(self, args):
+        dry_run, files = self.split_flags(args)
         if not files:
             return
         if len(files) < 2:
@@ -130,24 +269,24 @@ class DriveManager:
         if not self.cd(files[-1], context):
             return
         dest_id = self.curr_folder_id(context)
-        for file in files[:-1]:
-            dirname, filename = self.parse_filename(file)
-            context = copy(self.context)
-            if not self.cd(dirname, context):
-                continue
-            res = self.s.files().list(q=f"name = '{filename}' and '{self.curr_folder_id(context)}' in parents").execute()
-            if len(res["files"]) == 0:
-                print(f"No such file: {filename}")
-                continue
-            file_id = res["files"][0]["id"]
-            file_data = self.s.files().get(fileId=file_id, fields="parents").execute()
-            prev_parents = ",".join(file_data.get("parents"))
-            self.s.files().update(fileId=file_id, addParents=dest_id, removeParents=prev_parents).execute()
+        files = self.resolve(files[:-1], fields="id, name, mimeType, parents")
+
+        if dry_run:
+            dest = "/" + "/".join(name for name, _ in context)
+            for file in files:
+                print(f"would move {file['name']} to {dest}")
+            return
+
+        requests = [
+            (file, self.s.files().update(fileId=file["id"], addParents=dest_id, removeParents=",".join(file.get("parents", [])), fields="id"))
+            for file in files
+        ]
+        self.report("mv", files, self.batch_execute(requests))
 
 
 def main():
     dm = DriveManager()
-    print("Available commands: ls, cd <directory>, rm <file> <file> .., mv <file> <file> .. <directory>")
+    print("Available commands: ls, cd <directory>, rm [-n] <file|glob> .., mv [-n] <file|glob> .. <directory>")
     while True:
         try:
             line = input(f"{bcolors.OKBLUE}{dm.curr_path()}{bcolors.ENDC}$ ")
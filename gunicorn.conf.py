@@ -0,0 +1,12 @@
+# Gunicorn settings, used by the start command in railway.toml
+# Serves the WSGI app on sync workers, or with ASGI set, the ASGI app on uvicorn workers (see README.md)
+import os
+
+# We need to bind to ipv6 port to listen on private network as well
+bind = "[::]:8080"
+
+if os.environ.get("ASGI", "").lower() in ("true", "on", "ok", "y", "yes", "1"):
+    worker_class = "uvicorn_worker.UvicornWorker"
+    wsgi_app = "charkwayteow.asgi:application"
+else:
+    wsgi_app = "charkwayteow.wsgi:application"